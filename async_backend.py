@@ -0,0 +1,90 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import backend
+import hashing
+import sessions
+
+# Awaitable versions of the backend functions for the NiceGUI pages. Each call
+# runs on a bounded thread pool so a slow database round trip never blocks the
+# event loop. The executor is sized to the connection pool by default, so extra
+# calls queue here instead of parking threads on a pool checkout.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", backend.DB_POOL_MAX))
+
+executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="backend")
+# Calls that hash passwords wait on the hashing process pool; they get their
+# own threads so a login storm cannot occupy the ones serving page queries.
+auth_executor = ThreadPoolExecutor(max_workers=hashing.HASH_MAX_PENDING, thread_name_prefix="backend-auth")
+# Admission happens here, before a call is queued on auth_executor: callers
+# beyond HASH_MAX_PENDING wait up to HASH_QUEUE_TIMEOUT, then get HashingBusy.
+auth_slots = asyncio.Semaphore(hashing.HASH_MAX_PENDING)
+# Batch scaling is CPU work without database calls; it gets its own threads so
+# a large API batch does not hold up page queries.
+SCALE_WORKERS = int(os.getenv("SCALE_WORKERS", min(4, os.cpu_count() or 1)))
+scale_executor = ThreadPoolExecutor(max_workers=SCALE_WORKERS, thread_name_prefix="backend-scale")
+
+
+def _wrap(func, pool=executor):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+def _wrap_auth(func):
+    call = _wrap(func, auth_executor)
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            await asyncio.wait_for(auth_slots.acquire(), hashing.HASH_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise hashing.HashingBusy("password hashing is overloaded, try again shortly") from None
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            auth_slots.release()
+    return wrapper
+
+
+# ------------------------- Startup -------------------------
+init = _wrap(backend.init)
+check_health = _wrap(backend.check_health)
+
+# ------------------------- User Functions -------------------------
+register_user = _wrap_auth(backend.register_user)
+login_user = _wrap_auth(backend.login_user)
+get_user = _wrap(backend.get_user)
+get_all_users = _wrap(backend.get_all_users)
+list_users = _wrap(backend.list_users)
+approve_user = _wrap(backend.approve_user)
+approve_users = _wrap(backend.approve_users)
+delete_user = _wrap(backend.delete_user)
+delete_users = _wrap(backend.delete_users)
+change_password = _wrap_auth(backend.change_password)
+
+# ------------------------- Sessions -------------------------
+load_session = _wrap(sessions.load)
+save_session = _wrap(sessions.save)
+delete_session = _wrap(sessions.delete)
+
+# ------------------------- Recipe Functions -------------------------
+add_recipe = _wrap(backend.add_recipe)
+add_recipes = _wrap(backend.add_recipes)
+get_recipes = _wrap(backend.get_recipes)
+get_recipe_page = _wrap(backend.get_recipe_page)
+get_recipe = _wrap(backend.get_recipe)
+get_recipe_html = _wrap(backend.get_recipe_html)
+search_recipes = _wrap(backend.search_recipes)
+delete_recipe = _wrap(backend.delete_recipe)
+delete_recipes = _wrap(backend.delete_recipes)
+update_recipe = _wrap(backend.update_recipe)
+
+# ------------------------- Ingredient Functions -------------------------
+get_ingredients = _wrap(backend.get_ingredients)
+scale_recipe = _wrap(backend.scale_recipe)
+shopping_list = _wrap(backend.shopping_list)
+find_recipes_by_ingredient = _wrap(backend.find_recipes_by_ingredient)
+scale_batch = _wrap(backend.scale_batch, scale_executor)
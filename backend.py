@@ -1,9 +1,23 @@
+import json
+import math
 import os
-import psycopg2
-import bcrypt
+import threading
+import time
+from contextlib import contextmanager
+
 import jwt
 from datetime import datetime, timedelta
 
+import hashing
+from cache import TTLCache
+import events
+import metrics
+import rendering
+import scaling
+from db import query_hooks
+from storage import (INGREDIENT_FIELDS, RECIPE_FIELDS, RECIPE_SUMMARY_FIELDS, SEARCH_FIELDS, USER_COLUMNS,
+                     USER_FIELDS, open_storage)
+
 # ------------------------- Environment -------------------------
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -13,143 +27,589 @@ JWT_SECRET = os.getenv("JWT_SECRET", "super_secret_jwt_key_123")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRATION_MINUTES = int(os.getenv("JWT_EXPIRATION_MINUTES", 60))
 SUPERUSER_PASSWORD = os.getenv("PAS", "admin123")
+RECIPE_PAGE_SIZE = int(os.getenv("RECIPE_PAGE_SIZE", 20))
+USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", 50))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 1024))
+# Also keep rendered recipe HTML in the recipes table, so it survives restarts
+# and is shared between app instances
+RENDER_PERSIST = os.getenv("RENDER_PERSIST", "0") == "1"
+SCALE_CACHE_SIZE = int(os.getenv("SCALE_CACHE_SIZE", 4096))
+# Longest ingredient text one scaling job may carry, in characters
+SCALE_MAX_TEXT = int(os.getenv("SCALE_MAX_TEXT", 64 * 1024))
+# Postgres channel that carries change events between app processes
+EVENT_CHANNEL = os.getenv("EVENT_CHANNEL", "recipe_events")
 
 # ------------------------- Database Connection -------------------------
-try:
-    conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-    cursor = conn.cursor()
-except Exception as e:
-    print("Database connection failed:", e)
-    cursor = None
-
-# ------------------------- Tables Setup -------------------------
-if cursor:
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        username TEXT PRIMARY KEY,
-        password TEXT NOT NULL,
-        name TEXT,
-        email TEXT,
-        phone TEXT,
-        role TEXT,
-        approved INTEGER
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS recipes (
-        id SERIAL PRIMARY KEY,
-        username TEXT,
-        title TEXT,
-        content TEXT,
-        FOREIGN KEY(username) REFERENCES users(username)
-    )
-    """)
-    conn.commit()
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", 30))
+
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 10))
+
+# Set by init() to a storage.Storage for DATABASE_URL (a Postgres DSN or
+# sqlite:///path/to/file.db); backend functions treat a missing store as
+# "database unavailable"
+store = None
 
 # ------------------------- Transaction-safe Helpers -------------------------
-def safe_execute(query, params=None):
-    if not cursor:
-        return None
-    try:
-        cursor.execute(query, params or ())
-        conn.commit()
-        return cursor
-    except Exception as e:
-        print("DB Error:", e)
-        conn.rollback()
-        return None
+def safe_execute(query, params=None, fetch=None):
+    """Run one statement on a pooled connection and commit it.
+
+    ``fetch`` selects the result: ``"one"`` or ``"all"`` rows, otherwise the
+    affected row count. Returns None on error. A statement that failed because
+    the connection dropped is retried once on a fresh connection, unless it
+    was the commit that failed.
+    """
+    if not store: return None
+    return store.execute(query, params, fetch)
+
+def run_transaction(work):
+    """Call ``work(cursor)`` on one pooled connection and commit once.
+
+    Returns what ``work`` returns, or None on error. Like safe_execute, the
+    whole unit is retried once if the connection dropped before the commit. Inside
+    ``transaction()`` the work joins the open transaction instead and errors
+    propagate so the whole unit rolls back.
+    """
+    if not store: return None
+    return store.run(work)
+
+# ------------------------- Unit of Work -------------------------
+@contextmanager
+def transaction():
+    """Group backend calls made in this thread into one transaction and commit.
+
+    Nested blocks join the outermost one. Cache invalidations registered with
+    after_commit run only once the commit succeeded.
+    """
+    if not store:
+        raise RuntimeError("database is not available")
+    with store.transaction():
+        yield
+
+def after_commit(callback):
+    if store:
+        store.after_commit(callback)
+    else:
+        callback()
+
+def pool_stats():
+    return store.stats() if store else {}
+
+# ------------------------- Instrumentation -------------------------
+query_hooks.append(metrics.record_query)
+
+def _pool_metrics():
+    stats = pool_stats()
+    return [
+        ("db_pool_size", "gauge", "Open connections, including ones being opened.", stats.get("size", 0)),
+        ("db_pool_idle", "gauge", "Connections idle in the pool.", stats.get("idle", 0)),
+        ("db_pool_in_use", "gauge", "Connections checked out.", stats.get("in_use", 0)),
+        ("db_pool_checkouts_total", "counter", "Connections handed out by the pool.", stats.get("checkouts", 0)),
+        ("db_pool_checkout_wait_seconds_total", "counter", "Time spent waiting for a connection.",
+         stats.get("wait_time_total", 0.0)),
+        ("db_pool_checkout_wait_seconds_max", "gauge", "Longest wait for a connection.", stats.get("wait_time_max", 0.0)),
+        ("db_pool_timeouts_total", "counter", "Checkouts that gave up waiting.", stats.get("timeouts", 0)),
+        ("db_pool_reconnects_total", "counter",
+         "Idle connections closed after a failed health check or a dropped connection.", stats.get("reconnects", 0)),
+    ]
+metrics.sources.append(_pool_metrics)
+
+# ------------------------- User Cache -------------------------
+# Profiles returned by get_user and the list behind get_all_users. Writes
+# through this module invalidate them; the TTL bounds staleness otherwise.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+user_list_cache = TTLCache(maxsize=1, ttl=USER_CACHE_TTL)
+
+def invalidate_user(username):
+    def invalidate():
+        user_cache.pop(username)
+        user_list_cache.clear()
+    after_commit(invalidate)
+
+def invalidate_users(usernames):
+    def invalidate():
+        for username in usernames:
+            user_cache.pop(username)
+        user_list_cache.clear()
+    after_commit(invalidate)
+
+def cache_stats():
+    return {"users": user_cache.stats(), "user_list": user_list_cache.stats()}
+
+def _cache_metrics():
+    return [sample for name, stats in cache_stats().items()
+            for sample in metrics.cache_samples(f"user_cache_{name}", stats)]
+metrics.sources.append(_cache_metrics)
+
+# ------------------------- Rendered Recipe Cache -------------------------
+# Recipe id -> (content hash, html). Hits are checked against the hash of the
+# content just read, so an entry is never served for changed content and needs
+# no TTL; updates and deletes drop entries early to free their slots.
+render_cache = TTLCache(maxsize=RENDER_CACHE_SIZE, ttl=float("inf"))
+
+def invalidate_rendered(recipe_ids):
+    def invalidate():
+        for recipe_id in recipe_ids:
+            render_cache.pop(recipe_id)
+    after_commit(invalidate)
+
+def _render_metrics():
+    return metrics.cache_samples("recipe_html_cache", render_cache.stats())
+metrics.sources.append(_render_metrics)
+
+# ------------------------- Scaling Cache -------------------------
+# Batch scaling results by (normalized ingredient text, factor, normalize),
+# and parsed ingredient lists by normalized text so the same list scaled by
+# another factor is not parsed again. Pure functions of the key: no TTL.
+scale_cache = TTLCache(maxsize=SCALE_CACHE_SIZE, ttl=float("inf"))
+parse_cache = TTLCache(maxsize=SCALE_CACHE_SIZE, ttl=float("inf"))
+
+def _scale_metrics():
+    return [sample for name, cache in (("result", scale_cache), ("parse", parse_cache))
+            for sample in metrics.cache_samples(f"scale_{name}_cache", cache.stats())]
+metrics.sources.append(_scale_metrics)
+
+# ------------------------- Change Events -------------------------
+# Writes publish what changed once committed (see events.py), so open pages
+# can update in place:
+#   "users":   {"action": "registered" | "approved" | "deleted", "usernames": [...]}
+#   "recipes": {"action": "added" | "updated" | "deleted", "username": ..., "ids": [...]}
+# "updated" also carries the new "title". On Postgres the events reach the
+# other app processes too; on SQLite they stay in this process.
+PAYLOAD_LIMIT = 7000  # NOTIFY payloads must stay under 8000 bytes
+
+def publish(topic, payload):
+    after_commit(lambda: events.publish(topic, payload))
+
+def _relay(topic, payload):
+    if not store: return
+    message = json.dumps({"origin": events.ORIGIN, "topic": topic, "payload": payload})
+    if len(message) > PAYLOAD_LIMIT:
+        # Too many rows to list: receivers reload instead of patching rows
+        payload = {k: v for k, v in payload.items() if k not in ("usernames", "ids")}
+        message = json.dumps({"origin": events.ORIGIN, "topic": topic, "payload": payload})
+    store.notify(EVENT_CHANNEL, message)
+events.relays.append(_relay)
+
+def _receive(message):
+    event = json.loads(message)
+    if event["origin"] == events.ORIGIN: return
+    # Another process wrote; its caches were invalidated there, not here
+    payload = event["payload"]
+    if event["topic"] == "users":
+        if payload.get("usernames") is None:
+            user_cache.clear()
+        for username in payload.get("usernames") or []:
+            user_cache.pop(username)
+        user_list_cache.clear()
+    events.deliver(event["topic"], payload)
 
 # ------------------------- User Functions -------------------------
 def create_superuser():
-    if not cursor: return
-    cur = safe_execute("SELECT * FROM users WHERE username=%s", ("admin",))
-    if cur and not cur.fetchone():
-        hashed_pw = bcrypt.hashpw(SUPERUSER_PASSWORD.encode(), bcrypt.gensalt()).decode()
-        safe_execute(
-            "INSERT INTO users (username,password,name,email,phone,role,approved) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-            ("admin", hashed_pw, "Super Admin", "admin@example.com", "0000000000", "superuser", 1)
-        )
+    if not store: return
+    if store.user_exists("admin") is False:
+        hashed_pw = hashing.hash_password(SUPERUSER_PASSWORD)
+        store.insert_user("admin", hashed_pw, "Super Admin", "admin@example.com", "0000000000", "superuser", 1)
+        invalidate_user("admin")
 
 def register_user(username, password, name, email, phone):
-    if not cursor: return False
-    cur = safe_execute("SELECT * FROM users WHERE username=%s", (username,))
-    if cur and cur.fetchone(): return False
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    safe_execute(
-        "INSERT INTO users (username,password,name,email,phone,role,approved) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-        (username, hashed_pw, name, email, phone, "user", 0)
-    )
+    if not store: return False
+    hashed_pw = hashing.hash_password(password)
+    # One statement: an existing username inserts nothing
+    inserted = store.insert_user(username, hashed_pw, name, email, phone, "user", 0)
+    if not inserted: return False
+    invalidate_user(username)
+    publish("users", {"action": "registered", "usernames": [username]})
     return True
 
 def login_user(username, password):
-    if not cursor: return None
-    cur = safe_execute("SELECT * FROM users WHERE username=%s", (username,))
-    user = cur.fetchone() if cur else None
-    if not user: return None
-    if int(user[6]) != 1: return None
-    if not bcrypt.checkpw(password.encode(), user[1].encode()): return None
+    if not store: return None
+    row = store.user_login(username)
+    if not row: return None
+    hashed_pw, role, approved = row
+    if int(approved) != 1: return None
+    if not hashing.check_password(password, hashed_pw): return None
+    if hashing.needs_rehash(hashed_pw):
+        # Upgrade hashes made with an older work factor while the plain password is at hand
+        store.set_password(username, hashing.hash_password(password), old_password=hashed_pw)
     payload = {
         "username": username,
-        "role": user[5],
+        "role": role,
         "exp": datetime.utcnow() + timedelta(minutes=JWT_EXPIRATION_MINUTES)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def get_user(username):
-    if not cursor: return None
-    cur = safe_execute("SELECT * FROM users WHERE username=%s", (username,))
-    user = cur.fetchone() if cur else None
-    if not user: return None
-    return {
-        "username": user[0],
-        "name": user[2],
-        "email": user[3],
-        "phone": user[4],
-        "role": user[5],
-        "approved": user[6]
-    }
+    if not store: return None
+    cached = user_cache.get(username)
+    if cached is not None:
+        return dict(cached)
+    row = store.find_user(username)
+    if not row: return None
+    info = dict(zip(USER_FIELDS, row))
+    user_cache.set(username, info)
+    return dict(info)
 
 def get_all_users():
-    if not cursor: return []
-    cur = safe_execute("SELECT * FROM users")
-    users = cur.fetchall() if cur else []
-    return [{"username": u[0], "name": u[2], "email": u[3], "phone": u[4], "role": u[5], "approved": u[6]} for u in users]
+    if not store: return []
+    cached = user_list_cache.get("all")
+    if cached is not None:
+        return [dict(u) for u in cached]
+    users = store.all_users()
+    if users is None: return []
+    result = [dict(zip(USER_FIELDS, u)) for u in users]
+    user_list_cache.set("all", result)
+    return [dict(u) for u in result]
+
+def list_users(approved=None, role=None, search=None, after=None, limit=None):
+    """One page of users without password hashes, ordered by username.
+
+    ``approved`` and ``role`` filter exactly, ``search`` is a username
+    prefix, and ``after`` is the last username of the previous page.
+    """
+    if not store: return {"users": [], "next_after": None}
+    limit = limit or USER_PAGE_SIZE
+    rows = store.list_users(USER_COLUMNS, approved, role, search, after, limit + 1) or []
+    users = [dict(zip(USER_FIELDS, u)) for u in rows[:limit]]
+    next_after = users[-1]["username"] if len(rows) > limit else None
+    return {"users": users, "next_after": next_after}
 
 def approve_user(username):
-    safe_execute("UPDATE users SET approved=1 WHERE username=%s", (username,))
+    if not store: return
+    store.approve_users([username])
+    invalidate_user(username)
+    publish("users", {"action": "approved", "usernames": [username]})
+
+def approve_users(usernames):
+    usernames = list(usernames)
+    if not store or not usernames: return 0
+    count = store.approve_users(usernames)
+    invalidate_users(usernames)
+    if count: publish("users", {"action": "approved", "usernames": usernames})
+    return count or 0
 
 def delete_user(username):
-    if not cursor or username=="admin": return False
-    safe_execute("DELETE FROM users WHERE username=%s", (username,))
+    if not store or username=="admin": return False
+    store.delete_users([username])
+    invalidate_user(username)
+    publish("users", {"action": "deleted", "usernames": [username]})
     return True
 
+def delete_users(usernames):
+    usernames = [u for u in usernames if u != "admin"]
+    if not store or not usernames: return 0
+    count = store.delete_users(usernames)
+    invalidate_users(usernames)
+    if count: publish("users", {"action": "deleted", "usernames": usernames})
+    return count or 0
+
 def change_password(username, new_password):
-    if not cursor: return False
-    hashed_pw = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-    safe_execute("UPDATE users SET password=%s WHERE username=%s", (hashed_pw, username))
+    if not store: return False
+    hashed_pw = hashing.hash_password(new_password)
+    store.set_password(username, hashed_pw)
+    invalidate_user(username)
     return True
 
+# ------------------------- Session Functions -------------------------
+# Login tokens by browser session id, used by sessions.DatabaseSessionStore
+def get_session(session_id):
+    if not store: return None
+    return store.session_token(session_id, time.time())
+
+def save_session(session_id, token, ttl):
+    if not store: return False
+    return bool(store.save_session(session_id, token, time.time() + ttl))
+
+def delete_session(session_id):
+    if not store: return False
+    return store.delete_session(session_id) is not None
+
+def purge_sessions():
+    if not store: return 0
+    return store.purge_sessions(time.time()) or 0
+
 # ------------------------- Recipe Functions -------------------------
 def add_recipe(username, title, content):
-    if not cursor: return False
-    cur = safe_execute(
-        "INSERT INTO recipes (username,title,content) VALUES (%s,%s,%s)",
-        (username, title, content)
-    )
-    return bool(cur)
+    if not store: return False
+    ids = store.insert_recipes(username, [(title, content)])
+    if ids is None: return False
+    publish("recipes", {"action": "added", "username": username, "ids": ids})
+    return True
+
+def add_recipes(username, recipes):
+    # recipes: iterable of (title, content); one INSERT and one ingredient write for the batch
+    recipes = list(recipes)
+    if not store or not recipes: return []
+    ids = store.insert_recipes(username, recipes) or []
+    if ids: publish("recipes", {"action": "added", "username": username, "ids": ids})
+    return ids
 
 def get_recipes(username):
-    if not cursor: return []
-    cur = safe_execute("SELECT id,username,title,content FROM recipes WHERE username=%s", (username,))
-    rows = cur.fetchall() if cur else []
-    return [{"id": r[0], "username": r[1], "title": r[2], "content": r[3]} for r in rows]
+    if not store: return []
+    rows = store.recipes(username) or []
+    return [dict(zip(RECIPE_FIELDS, r)) for r in rows]
+
+def get_recipe_page(username, after_title=None, limit=None):
+    # Keyset pagination on the (username, title) index: id/title summaries only
+    if not store: return {"recipes": [], "next_after": None}
+    limit = limit or RECIPE_PAGE_SIZE
+    rows = store.recipe_page(username, after_title, limit + 1) or []
+    recipes = [dict(zip(RECIPE_SUMMARY_FIELDS, r)) for r in rows[:limit]]
+    next_after = recipes[-1]["title"] if len(rows) > limit else None
+    return {"recipes": recipes, "next_after": next_after}
+
+def get_recipe(username, recipe_id):
+    if not store: return None
+    r = store.recipe(username, recipe_id)
+    if not r: return None
+    return dict(zip(RECIPE_FIELDS, r))
+
+def get_recipe_html(username, recipe_id):
+    """The recipe with its markdown body rendered to HTML, re-rendered only
+    when the content changed since it was cached or persisted."""
+    if not store: return None
+    r = store.recipe_rendered(username, recipe_id)
+    if not r: return None
+    recipe_id, title, content, stored_html, stored_hash = r
+    digest = rendering.content_hash(content)
+    cached = render_cache.get(recipe_id)
+    if cached is not None and cached[0] == digest:
+        return {"id": recipe_id, "title": title, "html": cached[1]}
+    if stored_hash == digest:
+        html = stored_html
+    else:
+        html = rendering.render_markdown(content)
+        if RENDER_PERSIST:
+            store.save_rendered(recipe_id, digest, html)
+    render_cache.set(recipe_id, (digest, html))
+    return {"id": recipe_id, "title": title, "html": html}
+
+def search_recipes(username, query, offset=0, limit=None):
+    # Ranked full-text search; snippets mark matches with **
+    if not store or not query.strip(): return {"results": [], "next_offset": None}
+    limit = limit or RECIPE_PAGE_SIZE
+    rows = store.search_recipes(username, query, offset, limit + 1) or []
+    results = [dict(zip(SEARCH_FIELDS, r)) for r in rows[:limit]]
+    next_offset = offset + limit if len(rows) > limit else None
+    return {"results": results, "next_offset": next_offset}
+
+def delete_recipe(username, recipe_id):
+    if not store: return False
+    deleted = bool(store.delete_recipes(username, [recipe_id]))
+    if deleted:
+        invalidate_rendered([recipe_id])
+        publish("recipes", {"action": "deleted", "username": username, "ids": [recipe_id]})
+    return deleted
+
+def delete_recipes(username, recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not store or not recipe_ids: return 0
+    count = store.delete_recipes(username, recipe_ids) or 0
+    if count:
+        invalidate_rendered(recipe_ids)
+        publish("recipes", {"action": "deleted", "username": username, "ids": recipe_ids})
+    return count
+
+def update_recipe(username, recipe_id, new_title, new_content):
+    if not store: return False
+    updated = bool(store.update_recipe(username, recipe_id, new_title, new_content))
+    if updated:
+        invalidate_rendered([recipe_id])
+        publish("recipes", {"action": "updated", "username": username, "ids": [recipe_id], "title": new_title})
+    return updated
+
+# ------------------------- Ingredient Functions -------------------------
+def get_ingredients(username, recipe_id):
+    if not store: return []
+    rows = store.ingredients(username, recipe_id) or []
+    return [dict(zip(INGREDIENT_FIELDS, r)) for r in rows]
+
+def scale_recipe(username, recipe_id, factor, normalize=False):
+    # Quantities are multiplied in SQL; only the unit formatting happens here
+    if not store: return None
+    rows = store.ingredients(username, recipe_id, factor)
+    if rows is None: return None
+    return "\n".join(scaling.format_ingredient(name, qty, written_unit, normalize)
+                     for name, qty, unit, written_unit in rows)
+
+def shopping_list(username, recipe_factors, normalize=True):
+    # recipe_factors maps recipe id -> scale factor; totals are summed per name and base unit
+    if not store or not recipe_factors: return []
+    rows = store.shopping_list(username, recipe_factors) or []
+    return [scaling.format_ingredient(name, qty, unit, normalize) for name, qty, unit in rows]
+
+def find_recipes_by_ingredient(username, ingredient):
+    # Prefix match on the lower(name) index
+    if not store or not ingredient.strip(): return []
+    rows = store.recipes_with_ingredient(username, ingredient.strip().lower()) or []
+    return [dict(zip(RECIPE_SUMMARY_FIELDS, r)) for r in rows]
+
+def _scale_key(job):
+    # (text, factor, normalize) for a valid job, otherwise an error message
+    if not isinstance(job, dict): return None, "job must be an object"
+    text = job.get("ingredients")
+    if not isinstance(text, str): return None, "ingredients must be a string"
+    if len(text) > SCALE_MAX_TEXT: return None, f"ingredients must be at most {SCALE_MAX_TEXT} characters"
+    try:
+        base, target = float(job.get("base")), float(job.get("target"))
+    except (TypeError, ValueError, OverflowError):
+        # OverflowError: a JSON integer too large for a float
+        return None, "base and target must be numbers"
+    if not (math.isfinite(base) and math.isfinite(target)) or base <= 0 or target < 0:
+        return None, "base must be positive and target zero or more"
+    factor = target / base
+    if not math.isfinite(factor):
+        return None, "target / base is too large"
+    return (scaling.normalize_text(text), factor, bool(job.get("normalize", False))), None
+
+def scale_batch(jobs):
+    """Scale ingredient lists given as ``{"ingredients", "base", "target",
+    "normalize"}`` jobs, returning one result per job in order.
+
+    A result is ``{"factor", "ingredients": [{"name", "quantity", "unit"}],
+    "text", "errors"}`` like the /calculate page shows, or ``{"error"}`` for
+    an invalid job or one whose scaled quantities overflow. Repeated jobs are served from scale_cache; the rest are
+    scaled together in one pass.
+    """
+    keys, results = [], {}
+    pending = {}  # keys to compute, in first-seen order
+    for job in jobs:
+        key, error = _scale_key(job)
+        keys.append(key or error)
+        if key and key not in results and key not in pending:
+            cached = scale_cache.get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = None
+    if pending:
+        parsed = []
+        for text, _, _ in pending:
+            p = parse_cache.get(text)
+            if p is None:
+                p = scaling.parse(text)
+                parse_cache.set(text, p)
+            parsed.append(p)
+        scaled = scaling.scale_many(parsed, [factor for _, factor, _ in pending])
+        for key, p, quantities in zip(pending, parsed, scaled):
+            if not scaling.all_finite(quantities):
+                # inf has no JSON form; this job fails, not the whole response
+                result = {"error": "scaled quantities are too large"}
+            else:
+                items = scaling.items(p, quantities, key[2])
+                result = {
+                    "factor": key[1],
+                    "ingredients": [{"name": n, "quantity": q, "unit": u} for n, q, u in items],
+                    "text": "\n".join(scaling.format_line(n, q, u) for n, q, u in items),
+                    "errors": p.errors,
+                }
+            scale_cache.set(key, result)
+            results[key] = result
+    return [results[key] if isinstance(key, tuple) else {"error": key} for key in keys]
+
+# ------------------------- Startup -------------------------
+# Nothing connects at import time. init() is called explicitly (the web app
+# runs it in the background after binding its port) and records how long
+# each phase took so slow starts can be diagnosed.
+startup = {"ready": False, "error": None, "schema_version": None, "phases": {}, "total": None, "backfill": None}
+_init_lock = threading.Lock()
+_backfill_lock = threading.Lock()
+_backfill_thread = None
+
+def backfill_ingredients(batch_size=500):
+    """Parse the ingredients of recipes that have none stored yet.
+
+    Returns how many recipes were parsed; raises if the database fails
+    midway. One backfill runs at a time.
+    """
+    with _backfill_lock:
+        if not store:
+            raise RuntimeError("database is not available")
+        return store.backfill_ingredients(batch_size)
+
+def _backfill_in_background():
+    # Started by init() once the backend is ready, so a large recipes table
+    # does not hold up readiness
+    startup["backfill"] = "running"
+    try:
+        count = backfill_ingredients()
+    except Exception as e:
+        startup["backfill"] = "failed"
+        print("Ingredient backfill failed, run 'python bulk.py backfill' to finish it:", e)
+        return
+    startup["backfill"] = "done"
+    if count:
+        print(f"Parsed ingredients of {count} existing recipes")
+
+def init():
+    """Connect, bring the schema up to date and ensure the superuser exists.
+
+    Returns True once the backend is ready; safe to call repeatedly and from
+    several threads. On failure the error is kept in ``startup`` and the next
+    call tries again.
+    """
+    global store, _backfill_thread
+    with _init_lock:
+        if store:
+            return True
+        phases = {}
+        started = time.perf_counter()
+        phase_started = started
+        new_store = None
+        def phase(name):
+            nonlocal phase_started
+            now = time.perf_counter()
+            phases[name] = now - phase_started
+            phase_started = now
+        try:
+            new_store = open_storage(
+                DATABASE_URL,
+                connect_timeout=DB_CONNECT_TIMEOUT,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                healthcheck_interval=DB_HEALTHCHECK_INTERVAL,
+            )
+            phase("connect")
+            startup["schema_version"] = new_store.migrate()
+            phase("schema")
+            store = new_store
+            store.listen(EVENT_CHANNEL, _receive)
+            create_superuser()
+            phase("superuser")
+        except Exception as e:
+            print("Database initialization failed:", e)
+            # Unpublish a store that failed a later phase, so the next call starts over
+            if store is new_store:
+                store = None
+            if new_store is not None:
+                new_store.close()
+            startup.update(ready=False, error=str(e), phases=phases, total=time.perf_counter() - started)
+            return False
+        startup.update(ready=True, error=None, phases=phases, total=time.perf_counter() - started)
+        print("Backend ready in %.3fs (%s)" % (
+            startup["total"], ", ".join(f"{name} {secs:.3f}s" for name, secs in phases.items())))
+        if store.needs_backfill:
+            _backfill_thread = threading.Thread(target=_backfill_in_background, name="ingredient-backfill",
+                                                daemon=True)
+            _backfill_thread.start()
+        return True
 
-def delete_recipe(username,title):
-    safe_execute("DELETE FROM recipes WHERE username=%s AND title=%s", (username,title))
+def is_ready():
+    return store is not None
 
-def update_recipe(username, old_title, new_title, new_content):
-    safe_execute("UPDATE recipes SET title=%s, content=%s WHERE username=%s AND title=%s",
-                 (new_title,new_content,username,old_title))
+def check_health():
+    # Readiness probe: one round trip on a pooled connection
+    return safe_execute("SELECT 1", fetch="one") == (1,)
 
-# Ensure superuser exists
-create_superuser()
\ No newline at end of file
+def close():
+    global store
+    with _init_lock:
+        if store:
+            store.close()
+            store = None
+        startup["ready"] = False
@@ -0,0 +1,287 @@
+"""Benchmarks for the auth, recipe CRUD and ingredient scaling paths.
+
+    python benchmarks/bench.py run [--output FILE] [--url http://localhost:8080]
+    python benchmarks/bench.py compare BASELINE.json CANDIDATE.json
+
+Database benchmarks use DATABASE_URL (a local Postgres, or sqlite:///bench.db
+for the embedded backend) and create their own users and recipes, removed
+again afterwards. The page load scenario needs a running app at --url.
+Results are written as JSON so runs from different commits can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402
+import hashing  # noqa: E402
+import scaling  # noqa: E402
+import storage  # noqa: E402
+
+SEED = 1234
+BENCH_PREFIX = "bench_"
+INGREDIENTS = ["Flour", "Sugar", "Butter", "Milk", "Eggs", "Salt", "Yeast", "Water", "Olive oil", "Honey"]
+UNITS = ["g", "kg", "ml", "l", "tsp", "tbsp", "cup", ""]
+
+
+# ------------------------- Measurement -------------------------
+def summarize(samples, wall=None):
+    samples = sorted(samples)
+    n = len(samples)
+    def pct(p):
+        return samples[min(n - 1, int(p * n))]
+    total = wall if wall is not None else sum(samples)
+    return {
+        "n": n,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": pct(0.50) * 1000,
+        "p95_ms": pct(0.95) * 1000,
+        "p99_ms": pct(0.99) * 1000,
+        "min_ms": samples[0] * 1000,
+        "max_ms": samples[-1] * 1000,
+        "ops_per_sec": n / total if total else 0.0,
+    }
+
+
+def measure(func, repeat, warmup=1):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+# ------------------------- Fixtures -------------------------
+def ingredient_text(rng, lines):
+    return "\n".join(
+        f"{rng.choice(INGREDIENTS)} {rng.randint(1, 999) / rng.choice((1, 2, 4))} {rng.choice(UNITS)}".strip()
+        for _ in range(lines)
+    )
+
+
+def recipe_content(rng, lines=12):
+    return "## Ingredients\n" + ingredient_text(rng, lines) + "\n## Steps\nMix everything and bake."
+
+
+def create_user(username, password):
+    backend.register_user(username, password, "Bench User", "bench@example.com", "0000000000")
+    backend.approve_user(username)
+
+
+def cleanup():
+    page = backend.list_users(search=BENCH_PREFIX, limit=10000)
+    backend.delete_users([u["username"] for u in page["users"]])
+
+
+# ------------------------- Scenarios -------------------------
+def bench_scaling(results, rng, lines):
+    text = ingredient_text(rng, lines)
+    results[f"scale_ingredients_by_weight[{lines}]"] = measure(
+        lambda: scaling.scale_ingredients_by_weight(text, 1.0, 2.5), repeat=20)
+    targets = [0.5 * i for i in range(1, 101)]
+    results[f"scale_text_batch[{lines}x{len(targets)}]"] = measure(
+        lambda: scaling.scale_text_batch(text, targets), repeat=5)
+
+
+def bench_login(results, repeat):
+    username, password = BENCH_PREFIX + "login", "bench-password"
+    create_user(username, password)
+    results[f"login_user[rounds={hashing.BCRYPT_ROUNDS}]"] = measure(
+        lambda: backend.login_user(username, password), repeat=repeat)
+
+
+def bench_recipes(results, rng, sizes, repeat):
+    for size in sizes:
+        username = f"{BENCH_PREFIX}recipes_{size}"
+        create_user(username, "bench-password")
+        for start in range(0, size, 500):
+            backend.add_recipes(username, [
+                (f"Recipe {i:07d}", recipe_content(rng)) for i in range(start, min(size, start + 500))
+            ])
+        results[f"get_recipes[{size}]"] = measure(lambda: backend.get_recipes(username), repeat=repeat)
+        results[f"get_recipe_page[{size}]"] = measure(lambda: backend.get_recipe_page(username), repeat=repeat)
+
+    username = BENCH_PREFIX + "crud"
+    create_user(username, "bench-password")
+    counter = iter(range(10 ** 9))
+    results["add_recipe"] = measure(
+        lambda: backend.add_recipe(username, f"Added {next(counter)}", recipe_content(rng)), repeat=repeat)
+    recipe_ids = [r["id"] for r in backend.get_recipes(username)]
+    results["update_recipe"] = measure(
+        lambda: backend.update_recipe(username, rng.choice(recipe_ids), f"Updated {next(counter)}", recipe_content(rng)),
+        repeat=repeat)
+
+
+def bench_statements(results, size, repeat):
+    # Hot reads with and without server-side prepared statements; the gap is
+    # the parse and plan work PREPARE saves per call
+    store = backend.store
+    if store.dialect != "postgres":
+        print("SQLite always reuses compiled statements, skipping prepared statement benchmarks", file=sys.stderr)
+        return
+    username = f"{BENCH_PREFIX}recipes_{size}"
+    recipe_id = store.recipe_page(username, None, 1)[0][0]
+    calls = {
+        "find_user": lambda: store.find_user(username),
+        "recipe_page": lambda: store.recipe_page(username, None, backend.RECIPE_PAGE_SIZE),
+        "recipe": lambda: store.recipe(username, recipe_id),
+        "ingredients": lambda: store.ingredients(username, recipe_id, 2.0),
+    }
+    try:
+        for prepare in (False, True):
+            store.prepare = prepare
+            for name, call in calls.items():
+                # Warm up past the five custom plans Postgres makes before it settles on a generic one
+                results[f"{name}[{'prepared' if prepare else 'unprepared'}]"] = measure(call, repeat=repeat, warmup=10)
+    finally:
+        store.prepare = storage.DB_PREPARED_STATEMENTS
+
+
+async def _page_load(url, paths, clients, requests_per_client):
+    import httpx
+
+    samples, errors = [], 0
+    async def client():
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=url, timeout=30) as http:
+            for i in range(requests_per_client):
+                started = time.perf_counter()
+                response = await http.get(paths[i % len(paths)])
+                samples.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return samples, errors, time.perf_counter() - started
+
+
+def bench_pages(results, url, clients, requests_per_client):
+    # Pages reachable without a websocket login; each GET builds the page server-side
+    paths = ["/login", "/register", "/calculate", "/readyz"]
+    samples, errors, wall = asyncio.run(_page_load(url, paths, clients, requests_per_client))
+    summary = summarize(samples, wall)
+    summary["errors"] = errors
+    results[f"pages[{clients} clients]"] = summary
+
+
+def bench_concurrent_backend(results, size, clients, requests_per_client):
+    username = f"{BENCH_PREFIX}recipes_{size}"
+    def worker(_):
+        samples = []
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            backend.get_recipe_page(username)
+            backend.get_user(username)
+            samples.append(time.perf_counter() - started)
+        return samples
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        samples = [s for chunk in executor.map(worker, range(clients)) for s in chunk]
+    results[f"backend_mixed[{clients} clients]"] = summarize(samples, time.perf_counter() - started)
+
+
+# ------------------------- Runner -------------------------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    rng = random.Random(SEED)
+    results = {}
+    bench_scaling(results, rng, args.scale_lines)
+
+    if not args.skip_db:
+        if backend.init():
+            try:
+                cleanup()
+                bench_login(results, args.login_repeat)
+                bench_recipes(results, rng, args.sizes, args.repeat)
+                bench_concurrent_backend(results, args.sizes[-1], args.clients, args.requests)
+                bench_statements(results, args.sizes[-1], args.repeat)
+            finally:
+                cleanup()
+                backend.close()
+        else:
+            print("database unavailable, skipping database benchmarks", file=sys.stderr)
+    if args.url:
+        bench_pages(results, args.url, args.clients, args.requests)
+    hashing.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": SEED,
+        "results": results,
+    }
+    output = args.output or os.path.join("bench_results", report["commit"] + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, stats in results.items():
+        print(f"{name:45} mean {stats['mean_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms   {stats['ops_per_sec']:10.1f} ops/s")
+    print(f"results written to {output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    regressions = 0
+    print(f"{'benchmark':45} {baseline['commit']:>10} {candidate['commit']:>10}   change")
+    for name, stats in candidate["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            print(f"{name:45} {'-':>10} {stats[args.metric]:10.3f}")
+            continue
+        change = (stats[args.metric] - base[args.metric]) / base[args.metric] if base[args.metric] else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:45} {base[args.metric]:10.3f} {stats[args.metric]:10.3f}   {change:+7.1%}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recipe manager benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_cmd = sub.add_parser("run")
+    run_cmd.add_argument("--output", help="result file (default bench_results/<commit>.json)")
+    run_cmd.add_argument("--url", help="base URL of a running app for the page load scenario")
+    run_cmd.add_argument("--skip-db", action="store_true", help="only run benchmarks that need no database")
+    run_cmd.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="recipe collection sizes")
+    run_cmd.add_argument("--repeat", type=int, default=50)
+    run_cmd.add_argument("--login-repeat", type=int, default=10)
+    run_cmd.add_argument("--scale-lines", type=int, default=10000)
+    run_cmd.add_argument("--clients", type=int, default=20)
+    run_cmd.add_argument("--requests", type=int, default=20, help="requests per client in load scenarios")
+    cmp_cmd = sub.add_parser("compare")
+    cmp_cmd.add_argument("baseline")
+    cmp_cmd.add_argument("candidate")
+    cmp_cmd.add_argument("--metric", default="p50_ms", choices=("mean_ms", "p50_ms", "p95_ms", "p99_ms"))
+    cmp_cmd.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+    run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+import backend
+
+# ------------------------- Settings -------------------------
+DEFAULT_CHUNK_SIZE = 1000
+FIELDS = ("username", "title", "content")
+FORMATS = ("jsonl", "csv")
+
+
+class Progress:
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.started = time.monotonic()
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.rejected = 0
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "read": self.read,
+            "written": self.written,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "elapsed": elapsed,
+            "rows_per_sec": self.read / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def report(self):
+        if self.callback:
+            self.callback(self.as_dict())
+
+
+def guess_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+# ------------------------- Import -------------------------
+def read_records(fileobj, fmt):
+    # Malformed JSON lines come through as None and are rejected with the
+    # other invalid records instead of aborting the import
+    if fmt == "csv":
+        yield from csv.DictReader(fileobj)
+    else:
+        for line in fileobj:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+
+def is_valid(record):
+    return (
+        isinstance(record, dict)
+        and isinstance(record.get("username"), str) and record["username"] != ""
+        and isinstance(record.get("title"), str) and record["title"] != ""
+        and isinstance(record.get("content") or "", str)
+    )
+
+
+class ImportFailed(RuntimeError):
+    """The database failed to store a chunk. ``offset`` is the number of
+    records read before it, all of them already committed; ``stats`` are
+    the counters up to there."""
+
+    def __init__(self, offset, stats):
+        super().__init__(f"database error storing the records from #{offset + 1} on")
+        self.offset = offset
+        self.stats = stats
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_recipes(fileobj, fmt="jsonl", chunk_size=DEFAULT_CHUNK_SIZE, on_conflict="skip", progress=None):
+    """Stream recipes from ``fileobj`` into the database.
+
+    Records need ``username``, ``title`` and ``content``. Each chunk is one
+    multi-row INSERT and one commit. Malformed lines, records that are not
+    objects, lack a title or belong to unknown users are rejected; existing
+    titles are skipped or, with ``on_conflict="update"``, overwritten.
+    Returns the progress counters. Raises ImportFailed when the database
+    fails to store a chunk; the chunks before it stay committed.
+    """
+    if not backend.store:
+        raise RuntimeError("database is not available")
+    stats = Progress(progress)
+    for chunk in chunked(read_records(fileobj, fmt), chunk_size):
+        valid = [r for r in chunk if is_valid(r)]
+        if valid:
+            result = backend.store.import_recipes(valid, on_conflict)
+            if result is None:
+                raise ImportFailed(stats.read, stats.as_dict())
+            written, unknown = result
+            stats.written += written
+            stats.rejected += unknown
+            stats.skipped += len(valid) - unknown - written
+        stats.read += len(chunk)
+        stats.rejected += len(chunk) - len(valid)
+        stats.report()
+    return stats.as_dict()
+
+
+# ------------------------- Export -------------------------
+def export_recipes(fileobj, fmt="jsonl", username=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Stream recipes to ``fileobj`` in chunks (a server-side cursor on
+    Postgres) so memory stays flat regardless of table size. Returns the
+    progress counters."""
+    if not backend.store:
+        raise RuntimeError("database is not available")
+    stats = Progress(progress)
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(fileobj)
+        writer.writerow(FIELDS)
+    for rows in backend.store.export_recipes(username, chunk_size):
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                fileobj.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+        stats.read += len(rows)
+        stats.written += len(rows)
+        stats.report()
+    return stats.as_dict()
+
+
+# ------------------------- Backfill -------------------------
+def backfill_ingredients(batch_size=DEFAULT_CHUNK_SIZE):
+    """Parse the ingredients of recipes that have none stored yet.
+
+    The app runs it in the background after the migration that adds
+    recipe_ingredients; this reruns it, e.g. after that run failed or
+    recipes were written by an older app version. Returns how many recipes
+    were parsed.
+    """
+    return backend.backfill_ingredients(batch_size)
+
+
+# ------------------------- Command Line -------------------------
+def print_progress(stats):
+    print(
+        f"{stats['read']} read, {stats['written']} written, {stats['skipped']} skipped, "
+        f"{stats['rejected']} rejected ({stats['rows_per_sec']:.0f} rows/s)",
+        file=sys.stderr
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import and export of recipes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("import", "export"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("path", help="file to read or write, '-' for stdin/stdout")
+        cmd.add_argument("--format", choices=FORMATS)
+        cmd.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    sub.choices["import"].add_argument("--on-conflict", choices=("skip", "update"), default="skip")
+    sub.choices["export"].add_argument("--user", help="only export this user's recipes")
+    backfill_cmd = sub.add_parser("backfill", help="parse ingredients of recipes that have none stored")
+    backfill_cmd.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if not backend.init():
+        sys.exit(1)
+    if args.command == "backfill":
+        started = time.monotonic()
+        count = backfill_ingredients(args.chunk_size)
+        print(f"parsed {count} recipes in {time.monotonic() - started:.1f}s", file=sys.stderr)
+        return
+    fmt = args.format or guess_format(args.path)
+    if args.command == "import":
+        fileobj = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+        with fileobj:
+            try:
+                stats = import_recipes(fileobj, fmt, args.chunk_size, args.on_conflict, print_progress)
+            except ImportFailed as e:
+                print_progress(e.stats)
+                # Committed titles are skipped when the same file is imported again
+                sys.exit(f"import stopped: {e}")
+    else:
+        fileobj = sys.stdout if args.path == "-" else open(args.path, "w", newline="", encoding="utf-8")
+        with fileobj:
+            stats = export_recipes(fileobj, fmt, args.user, args.chunk_size, print_progress)
+    print(f"done in {stats['elapsed']:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def is_disconnect(error):
+    # Errors raised by the server carry a SQLSTATE; a dropped socket or a
+    # closed connection is reported client-side without one.
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    return isinstance(error, psycopg2.OperationalError) and error.pgcode is None
+
+
+# ------------------------- Statement Hooks -------------------------
+# Called as hook(query, duration, rowcount, error) after every statement run
+# through an InstrumentedCursor or SqliteCursor, including those built by
+# execute_values and named (server-side) cursors.
+query_hooks = []
+
+
+def run_hooks(query, duration, rowcount, error):
+    for hook in query_hooks:
+        try:
+            hook(query, duration, rowcount, error)
+        except Exception as hook_error:
+            print("Query hook failed:", hook_error)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        error = None
+        try:
+            return super().execute(query, vars)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            run_hooks(query, time.perf_counter() - started, self.rowcount, error)
+
+
+# ------------------------- SQLite Adapter -------------------------
+# Gives sqlite3 connections the slice of the psycopg2 API the pool and the
+# storage layer use: %s placeholders, cursors as context managers and the
+# same statement hooks.
+_PARAM = re.compile(r"%([s%])")
+
+
+@lru_cache(maxsize=1024)
+def sqlite_query(query):
+    return _PARAM.sub(lambda m: "?" if m.group(1) == "s" else "%", query)
+
+
+class SqliteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        error = None
+        try:
+            self._cursor.execute(sqlite_query(query), vars or ())
+            return self
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            run_hooks(query, time.perf_counter() - started, self._cursor.rowcount, error)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.closed = False
+
+    def cursor(self):
+        return SqliteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self.closed = True
+        self._conn.close()
+
+
+# ------------------------- Prepared Statements -------------------------
+class PreparingConnection(psycopg2.extensions.connection):
+    # Names of the statements PREPAREd on this server session
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+@lru_cache(maxsize=256)
+def numbered_query(query):
+    # %s placeholders as PREPARE's $1, $2, ...
+    counter = iter(range(1, 1000))
+    return _PARAM.sub(lambda m: "$%d" % next(counter) if m.group(1) == "s" else "%", query)
+
+
+# ------------------------- Connection Pool -------------------------
+class ConnectionPool:
+    """Thread-safe pool with blocking checkout, health checks and wait statistics.
+
+    ``connect`` opens a new connection: a psycopg2 connection or a
+    SqliteConnection.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=30.0, healthcheck_interval=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool size: min=%s max=%s" % (minconn, maxconn))
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, last_used) pairs, most recently used last
+        self._size = 0   # open connections plus reserved slots being connected
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "reconnects": 0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout("no connection available after %.1fs" % self.timeout)
+                waited = True
+                self._cond.wait(remaining)
+
+            wait = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time_total"] += wait
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait)
+
+        # Connecting and health checks happen outside the lock so a slow
+        # server does not block other threads returning connections.
+        try:
+            if conn is not None and not self._healthy(conn, last_used):
+                self._close(conn)
+                conn = None
+                with self._cond:
+                    self._stats["reconnects"] += 1
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            # A no-op on idle connections for both psycopg2 and sqlite3
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._close(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard_idle(self, before):
+        """Close the idle connections checked in before ``before`` (monotonic).
+
+        Used once a connection turned out to be dropped: after a server
+        restart the idle ones are dead too, and their health check would not
+        run until they had been idle for ``healthcheck_interval``.
+        """
+        with self._cond:
+            stale = [(conn, t) for conn, t in self._idle if t <= before]
+            self._idle = [(conn, t) for conn, t in self._idle if t > before]
+            self._size -= len(stale)
+            self._stats["reconnects"] += len(stale)
+            self._cond.notify_all()
+        for conn, _ in stale:
+            self._close(conn)
+        return len(stale)
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            self.putconn(conn, discard=conn.closed)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["min"] = self.minconn
+            stats["max"] = self.maxconn
+        checkouts = stats["checkouts"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / checkouts if checkouts else 0.0
+        return stats
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
@@ -0,0 +1,52 @@
+import threading
+import uuid
+
+# ------------------------- Event Bus -------------------------
+# In-process publish/subscribe for "shared data changed" notices. The backend
+# publishes after a write committed; open pages subscribe to update in place.
+# Callbacks run in the publishing thread and must hand UI work to the event
+# loop themselves.
+#
+# Relays forward published events to other processes (backend relays them
+# through Postgres LISTEN/NOTIFY), which hand them back to deliver().
+
+# Identifies this process in relayed events so it can skip its own
+ORIGIN = uuid.uuid4().hex
+
+_lock = threading.Lock()
+_subscribers = {}  # topic -> [callback]
+relays = []
+
+
+def subscribe(topic, callback):
+    """Call ``callback(payload)`` for every event on ``topic``; returns a
+    function that unsubscribes it."""
+    with _lock:
+        _subscribers.setdefault(topic, []).append(callback)
+
+    def unsubscribe():
+        with _lock:
+            callbacks = _subscribers.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+    return unsubscribe
+
+
+def deliver(topic, payload):
+    # Local subscribers only
+    with _lock:
+        callbacks = list(_subscribers.get(topic, ()))
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception as e:
+            print("Event subscriber failed:", e)
+
+
+def publish(topic, payload):
+    deliver(topic, payload)
+    for relay in relays:
+        try:
+            relay(topic, payload)
+        except Exception as e:
+            print("Event relay failed:", e)
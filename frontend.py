@@ -1,21 +1,65 @@
-from nicegui import ui, app
+from nicegui import ui, app, background_tasks
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import backend
+import async_backend
+import events
+import hashing
 import jwt
 import asyncio
-from fractions import Fraction
-import re
+import functools
+import json
+import os
+import time
+import metrics
+import scaling
+# -------------------------
+# Page instrumentation
+# -------------------------
+def page(path, **kwargs):
+    # ui.page that records build latency and errors per route for /metrics
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed(*args, **kw):
+                started, error = time.perf_counter(), None
+                try:
+                    return await func(*args, **kw)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    metrics.record_page(path, time.perf_counter() - started, error)
+        else:
+            @functools.wraps(func)
+            def timed(*args, **kw):
+                started, error = time.perf_counter(), None
+                try:
+                    return func(*args, **kw)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    metrics.record_page(path, time.perf_counter() - started, error)
+        return ui.page(path, **kwargs)(timed)
+    return decorator
+
 # -------------------------
 # JWT helpers
 # -------------------------
+# Tokens live in the session store (sessions.py) under the browser's session
+# id, so any worker can serve any request
+def session_id() -> str:
+    return app.storage.browser['id']
+
 async def get_jwt() -> str:
-    return app.storage.user.get('jwt')
+    return await async_backend.load_session(session_id())
 
 async def set_jwt(token: str):
-    app.storage.user['jwt'] = token
+    await async_backend.save_session(session_id(), token)
 
 async def clear_jwt():
-    if 'jwt' in app.storage.user:
-        del app.storage.user['jwt']
+    await async_backend.delete_session(session_id())
 
 def decode_jwt(token: str):
     try:
@@ -24,6 +68,9 @@ def decode_jwt(token: str):
         return None
 
 async def require_login() -> dict:
+    if not backend.is_ready():
+        ui.label("The service is starting, please retry in a moment").classes("mx-auto mt-20 text-lg")
+        return None
     token = await get_jwt()
     if not token:
         ui.notify("Please log in first", color="red")
@@ -37,6 +84,24 @@ async def require_login() -> dict:
         return None
     return payload
 
+# -------------------------
+# Live updates
+# -------------------------
+def on_event(topic, handler):
+    # Call handler(payload) in this page's context for every backend event on
+    # topic until the page is closed. Events are published from worker threads,
+    # so they are handed to the event loop first.
+    client = ui.context.client
+    loop = asyncio.get_running_loop()
+    def deliver(payload):
+        loop.call_soon_threadsafe(client.safe_invoke, functools.partial(handler, payload))
+    client.on_delete(events.subscribe(topic, deliver))
+
+def notify_busy():
+    ui.notify("Server is busy, please try again in a moment", color="orange")
+
+NO_INGREDIENTS = "No ingredients found. List them under an 'Ingredients' heading or as '- Flour 500 g' items."
+
 def safe_close(dialog):
     try:
         dialog.close()
@@ -46,7 +111,7 @@ def safe_close(dialog):
 # -------------------------
 # Login Page
 # -------------------------
-@ui.page("/login")
+@page("/login")
 def login_page():
     with ui.card().classes("w-96 mx-auto mt-20 p-6 shadow-lg"):
         ui.label("Login").classes("text-2xl font-bold mb-4")
@@ -54,7 +119,11 @@ def login_page():
         password = ui.input("Password", password=True, password_toggle_button=True).classes("w-full")
 
         async def try_login():
-            token = backend.login_user(username.value, password.value)
+            try:
+                token = await async_backend.login_user(username.value, password.value)
+            except hashing.HashingBusy:
+                notify_busy()
+                return
             if token:
                 await set_jwt(token)
                 payload = decode_jwt(token)
@@ -69,7 +138,7 @@ def login_page():
 # -------------------------
 # Register Page
 # -------------------------
-@ui.page("/register")
+@page("/register")
 def register_page():
     with ui.card().classes("w-96 mx-auto mt-20 p-6 shadow-lg"):
         ui.label("Register").classes("text-2xl font-bold mb-4")
@@ -79,11 +148,16 @@ def register_page():
         username = ui.input("Username").classes("w-full")
         password = ui.input("Password", password=True, password_toggle_button=True).classes("w-full")
 
-        def do_register():
+        async def do_register():
             if not (full_name.value and email.value and phone.value and username.value and password.value):
                 ui.notify("All fields are required", color="red")
                 return
-            if backend.register_user(username.value, password.value, full_name.value, email.value, phone.value):
+            try:
+                registered = await async_backend.register_user(username.value, password.value, full_name.value, email.value, phone.value)
+            except hashing.HashingBusy:
+                notify_busy()
+                return
+            if registered:
                 ui.notify("Registration submitted. Waiting for approval.", color="green")
                 ui.navigate.to("/login")
             else:
@@ -95,7 +169,7 @@ def register_page():
 # -------------------------
 # Reset Password Page
 # -------------------------
-@ui.page("/reset_password")
+@page("/reset_password")
 def reset_password_page():
     with ui.card().classes("w-96 mx-auto mt-20 p-6 shadow-lg"):
         ui.label("Change Password").classes("text-2xl font-bold mb-4")
@@ -104,11 +178,15 @@ def reset_password_page():
         new_password = ui.input("New Password", password=True, password_toggle_button=True).classes("w-full")
 
         async def change():
-            token = backend.login_user(username.value, old_password.value)
-            if not token:
-                ui.notify("Invalid username or old password", color="red")
+            try:
+                token = await async_backend.login_user(username.value, old_password.value)
+                if not token:
+                    ui.notify("Invalid username or old password", color="red")
+                    return
+                await async_backend.change_password(username.value, new_password.value)
+            except hashing.HashingBusy:
+                notify_busy()
                 return
-            backend.change_password(username.value, new_password.value)
             ui.notify("Password changed successfully", color="green")
             ui.navigate.to("/login")
 
@@ -118,12 +196,12 @@ def reset_password_page():
 # -------------------------
 # Dashboard
 # -------------------------
-@ui.page("/")
+@page("/")
 async def main_page():
     payload = await require_login()
     if not payload: return
     username = payload["username"]
-    user_info = backend.get_user(username)
+    user_info = await async_backend.get_user(username)
 
     with ui.card().classes("w-full max-w-2xl mx-auto mt-10 p-6 shadow-lg"):
         ui.label(f"👋 Welcome, {user_info['name']}!").classes("text-2xl font-bold mb-2")
@@ -142,7 +220,7 @@ async def main_page():
 # -------------------------
 # Add Recipe Page
 # -------------------------
-@ui.page("/add_recipe")
+@page("/add_recipe")
 async def add_recipe_page():
     payload = await require_login()
     if not payload: return
@@ -153,8 +231,10 @@ async def add_recipe_page():
         title = ui.input("Title").classes("w-full")
         content = ui.textarea("Content").classes("w-full")
 
-        def save():
-            backend.add_recipe(username, title.value, content.value)
+        async def save():
+            if not await async_backend.add_recipe(username, title.value, content.value):
+                ui.notify("Could not save recipe. Titles must be unique.", color="red")
+                return
             ui.notify("Recipe added!", color="green")
             ui.navigate.to("/show_recipes")
 
@@ -164,55 +244,245 @@ async def add_recipe_page():
 # -------------------------
 # Show Recipes Page
 # -------------------------
-@ui.page("/show_recipes")
+@page("/show_recipes")
 async def show_recipes_page():
     payload = await require_login()
     if not payload: return
     username = payload["username"]
-    recipes = backend.get_recipes(username)
-
-    def refresh():
-        ui.navigate.to("/show_recipes")
+    state = {"after": None}
+    # Recipe id -> the card's elements, so single cards can change without a reload
+    cards = {}
+
+    def position(title):
+        # Cards are ordered by title like the pages they were loaded from,
+        # which the storage layer sorts by code point as str comparison does
+        return sum(1 for entry in cards.values() if entry["recipe"]["title"] < title)
+
+    def in_loaded_range(title):
+        return state["after"] is None or title < state["after"]
+
+    def remove_card(recipe_id):
+        entry = cards.pop(recipe_id, None)
+        if entry:
+            entry["card"].delete()
+        empty_label.visible = not cards
+
+    async def load_content(entry):
+        entry["loaded"] = True
+        recipe = await async_backend.get_recipe_html(username, entry["recipe"]["id"])
+        with entry["body"]:
+            if recipe:
+                # Rendered once per content version by the backend; styled and sanitized like ui.markdown
+                ui.html(recipe["html"], sanitize=True).classes("nicegui-markdown mb-2 whitespace-pre-wrap text-base font-normal")
+            else:
+                ui.label("Recipe not found").classes("text-red-500")
+
+    def recipe_card(r):
+        with ui.card().classes("w-full mb-2 p-3") as card:
+            # Content is fetched the first time the card is expanded
+            with ui.expansion(r["title"]).classes("w-full text-xl font-bold mb-2") as expansion:
+                body = ui.column().classes("w-full")
+            entry = cards[r["id"]] = {"recipe": r, "card": card, "expansion": expansion, "body": body, "loaded": False}
+
+            async def expanded(e):
+                if e.value and not entry["loaded"]:
+                    await load_content(entry)
+            expansion.on_value_change(expanded)
+
+            with ui.row().classes("gap-2"):
+                ui.button("Edit", on_click=lambda r=r: ui.navigate.to(f"/edit_recipe/{r['id']}")).classes("bg-blue-500 text-white text-sm")
+                def delete_confirm(r=r):
+                    # Outside the card, which a live update may delete while the dialog is open
+                    with ui.context.client.content:
+                        dialog = ui.dialog()
+                    with dialog, ui.card():
+                        ui.label(f"Delete '{r['title']}'?").classes("mb-2 font-semibold")
+                        async def confirm():
+                            await async_backend.delete_recipe(username, r["id"])
+                            ui.notify(f"'{r['title']}' deleted!", color="red")
+                            safe_close(dialog)
+                            remove_card(r["id"])
+                        ui.button("DELETE", on_click=confirm).classes("bg-red-500 text-white text-sm mt-2 mr-2")
+                        ui.button("CANCEL", on_click=lambda: safe_close(dialog)).classes("bg-gray-500 text-white text-sm mt-2")
+                    dialog.open()
+                ui.button("Delete", on_click=delete_confirm).classes("bg-red-500 text-white text-sm")
+                ui.button("Scale", on_click=lambda r=r: scale_dialog(r)).classes("bg-yellow-500 text-white text-sm")
+                entry["shop"] = ui.checkbox("Shopping list").classes("text-sm")
+        return card
+
+    def show_lines(title, lines):
+        with ui.context.client.content:
+            dialog = ui.dialog()
+        with dialog, ui.card().classes("w-96"):
+            ui.label(title).classes("mb-2 font-semibold")
+            if lines:
+                output = ui.textarea(value="\n".join(lines)).classes("w-full")
+                output._props["readonly"] = True
+            else:
+                ui.label(NO_INGREDIENTS).classes("text-gray-500")
+            ui.button("CLOSE", on_click=lambda: safe_close(dialog)).classes("bg-gray-500 text-white text-sm mt-2")
+        dialog.open()
+
+    def scale_dialog(r):
+        # Scaled from the parsed ingredient rows stored with the recipe
+        with ui.context.client.content:
+            dialog = ui.dialog()
+        with dialog, ui.card().classes("w-96"):
+            ui.label(f"Scale '{r['title']}'").classes("mb-2 font-semibold")
+            factor = ui.number("Factor", value=2, min=0).classes("w-full")
+            normalize = ui.checkbox("Normalize units (g/kg, ml/l)")
+            output = ui.textarea("Scaled Ingredients").classes("w-full")
+            output._props["readonly"] = True
+            async def scale():
+                if factor.value is None or factor.value < 0:
+                    ui.notify("Please enter a valid factor", color="red")
+                    return
+                text = await async_backend.scale_recipe(username, r["id"], float(factor.value), normalize.value)
+                if text is None:
+                    ui.notify("Could not scale recipe", color="red")
+                    return
+                output.value = text
+                if not text:
+                    ui.notify(NO_INGREDIENTS, color="orange", multi_line=True)
+            ui.button("SCALE", on_click=scale).classes("bg-blue-500 text-white text-sm mt-2 mr-2")
+            ui.button("CLOSE", on_click=lambda: safe_close(dialog)).classes("bg-gray-500 text-white text-sm mt-2")
+        dialog.open()
+
+    async def shopping_list():
+        recipe_ids = [recipe_id for recipe_id, entry in cards.items() if entry["shop"].value]
+        if not recipe_ids:
+            ui.notify("Tick 'Shopping list' on the recipes to shop for", color="orange")
+            return
+        lines = await async_backend.shopping_list(username, {recipe_id: 1.0 for recipe_id in recipe_ids})
+        show_lines(f"Shopping list for {len(recipe_ids)} recipe(s)", lines)
+
+    async def load_more():
+        page = await async_backend.get_recipe_page(username, state["after"])
+        with recipe_list:
+            for r in page["recipes"]:
+                # A card added live may already show a recipe from this page
+                if r["id"] not in cards:
+                    recipe_card(r)
+        state["after"] = page["next_after"]
+        more_button.visible = state["after"] is not None
+        empty_label.visible = not cards
+
+    async def reload():
+        cards.clear()
+        recipe_list.clear()
+        state["after"] = None
+        await load_more()
+
+    async def on_recipes(change):
+        # Changes from this user's other tabs and devices
+        if change.get("username") != username:
+            return
+        if change.get("ids") is None:
+            await reload()
+            return
+        for recipe_id in change["ids"]:
+            entry = cards.get(recipe_id)
+            if change["action"] == "deleted":
+                remove_card(recipe_id)
+            elif change["action"] == "updated" and entry:
+                title = change["title"]
+                if not in_loaded_range(title):
+                    # Now sorts into a page that is not loaded yet
+                    remove_card(recipe_id)
+                    continue
+                entry["recipe"]["title"] = title
+                entry["expansion"].text = title
+                entry["card"].move(target_index=position(title))
+                entry["body"].clear()
+                entry["loaded"] = False
+                if entry["expansion"].value:
+                    await load_content(entry)
+            elif change["action"] == "added" and not entry:
+                recipe = await async_backend.get_recipe(username, recipe_id)
+                if recipe and recipe_id not in cards and in_loaded_range(recipe["title"]):
+                    index = position(recipe["title"])
+                    with recipe_list:
+                        recipe_card({"id": recipe_id, "title": recipe["title"]}).move(target_index=index)
+                    empty_label.visible = False
+
+    def result_card(hit):
+        with ui.card().classes("w-full mb-2 p-3"):
+            ui.label(hit["title"]).classes("text-xl font-bold")
+            if hit.get("snippet"):
+                ui.markdown(hit["snippet"]).classes("text-base text-gray-700")
+            ui.button("Edit", on_click=lambda hit=hit: ui.navigate.to(f"/edit_recipe/{hit['id']}")).classes("bg-blue-500 text-white text-sm")
+
+    async def search(more=False):
+        query = (search_input.value or "").strip()
+        browse_view.visible = not query
+        search_view.visible = bool(query)
+        if not query:
+            return
+        ingredient_input.value = ""
+        if not more:
+            search_results.clear()
+            state["query"], state["offset"] = query, 0
+        page = await async_backend.search_recipes(username, state["query"], state["offset"])
+        with search_results:
+            for hit in page["results"]:
+                result_card(hit)
+        state["offset"] = page["next_offset"]
+        more_results_button.visible = state["offset"] is not None
+        no_results_label.visible = not search_results.default_slot.children
+
+    async def find_by_ingredient():
+        # Prefix match on the stored ingredient names, e.g. "flour"
+        ingredient = (ingredient_input.value or "").strip()
+        browse_view.visible = not ingredient
+        search_view.visible = bool(ingredient)
+        if not ingredient:
+            return
+        search_input.value = ""
+        search_results.clear()
+        hits = await async_backend.find_recipes_by_ingredient(username, ingredient)
+        with search_results:
+            for hit in hits:
+                result_card(hit)
+        more_results_button.visible = False
+        no_results_label.visible = not hits
 
     with ui.card().classes("w-full max-w-3xl mx-auto mt-10 p-6 shadow-lg"):
         ui.label("Your Recipes").classes("text-3xl font-bold mb-6")
-
-        if not recipes:
-            ui.label("No recipes yet. Add some!").classes("text-gray-500 text-lg")
-        else:
-            for r in recipes:
-                with ui.card().classes("w-full mb-2 p-3"):
-                    ui.label(r["title"]).classes("text-xl font-bold mb-2")
-                    ui.markdown(r["content"]).classes("mb-2 whitespace-pre-wrap text-base")
-
-                    with ui.row().classes("gap-2"):
-                        ui.button("Edit", on_click=lambda r=r: ui.navigate.to(f"/edit_recipe/{r['title']}")).classes("bg-blue-500 text-white text-sm")
-                        def delete_confirm(r=r):
-                            dialog = ui.dialog()
-                            with dialog, ui.card():
-                                ui.label(f"Delete '{r['title']}'?").classes("mb-2 font-semibold")
-                                def confirm():
-                                    backend.delete_recipe(username, r["title"])
-                                    ui.notify(f"'{r['title']}' deleted!", color="red")
-                                    safe_close(dialog)
-                                    refresh()
-                                ui.button("DELETE", on_click=confirm).classes("bg-red-500 text-white text-sm mt-2 mr-2")
-                                ui.button("CANCEL", on_click=lambda: safe_close(dialog)).classes("bg-gray-500 text-white text-sm mt-2")
-                            dialog.open()
-                        ui.button("Delete", on_click=delete_confirm).classes("bg-red-500 text-white text-sm")
+        search_input = ui.input("Search recipes").props("clearable").classes("w-full mb-4")
+        search_input.on("keydown.enter", lambda: search())
+        search_input.on("clear", lambda: search())
+        with ui.row().classes("w-full items-end gap-2 mb-4"):
+            ingredient_input = ui.input("Recipes using ingredient").props("clearable").classes("flex-grow")
+            ui.button("Shopping list", on_click=shopping_list).classes("bg-green-500 text-white")
+        ingredient_input.on("keydown.enter", lambda: find_by_ingredient())
+        ingredient_input.on("clear", lambda: find_by_ingredient())
+
+        with ui.column().classes("w-full") as browse_view:
+            empty_label = ui.label("No recipes yet. Add some!").classes("text-gray-500 text-lg")
+            empty_label.visible = False
+            recipe_list = ui.column().classes("w-full")
+            more_button = ui.button("Load more", on_click=load_more).classes("w-full mt-2 bg-gray-200 text-black")
+
+        with ui.column().classes("w-full") as search_view:
+            no_results_label = ui.label("No matching recipes.").classes("text-gray-500 text-lg")
+            search_results = ui.column().classes("w-full")
+            more_results_button = ui.button("More results", on_click=lambda: search(more=True)).classes("w-full mt-2 bg-gray-200 text-black")
+        search_view.visible = False
+
+    await load_more()
+    on_event("recipes", on_recipes)
 
     ui.button("Back to Dashboard", on_click=lambda: ui.navigate.to("/")).classes("mt-4 bg-gray-500 text-white")
 
 # -------------------------
 # Edit Recipe Page
 # -------------------------
-@ui.page("/edit_recipe/{title}")
-async def edit_recipe_page(title: str):
+@page("/edit_recipe/{recipe_id}")
+async def edit_recipe_page(recipe_id: int):
     payload = await require_login()
     if not payload: return
     username = payload["username"]
-    recipes = backend.get_recipes(username)
-    recipe = next((r for r in recipes if r["title"] == title), None)
+    recipe = await async_backend.get_recipe(username, recipe_id)
     if not recipe:
         ui.label("Recipe not found").classes("text-red-500")
         return
@@ -220,8 +490,10 @@ async def edit_recipe_page(title: str):
     with ui.card().classes("w-96 mx-auto mt-20 p-6 shadow-lg"):
         new_title = ui.input("Title", value=recipe["title"]).classes("w-full")
         new_content = ui.textarea("Content", value=recipe["content"]).classes("w-full")
-        def update():
-            backend.update_recipe(username, title, new_title.value, new_content.value)
+        async def update():
+            if not await async_backend.update_recipe(username, recipe["id"], new_title.value, new_content.value):
+                ui.notify("Could not update recipe. Titles must be unique.", color="red")
+                return
             ui.notify("Recipe updated!", color="green")
             ui.navigate.to("/show_recipes")
         ui.button("UPDATE", on_click=update).classes("w-full bg-blue-500 text-white mt-4")
@@ -229,7 +501,7 @@ async def edit_recipe_page(title: str):
 # -------------------------
 # Superuser Dashboard
 # -------------------------
-@ui.page("/superuser")
+@page("/superuser")
 async def superuser_page():
     payload = await require_login()
     if not payload or payload["role"]!="superuser":
@@ -237,45 +509,150 @@ async def superuser_page():
         ui.navigate.to("/login")
         return
 
-    users = backend.get_all_users()
-    with ui.card().classes("w-full max-w-3xl mx-auto mt-10 p-6 shadow-lg"):
+    state = {"after": None}
+    columns = [
+        {"name": "username", "label": "Username", "field": "username", "align": "left"},
+        {"name": "name", "label": "Name", "field": "name", "align": "left"},
+        {"name": "email", "label": "Email", "field": "email", "align": "left"},
+        {"name": "phone", "label": "Phone", "field": "phone", "align": "left"},
+        {"name": "role", "label": "Role", "field": "role", "align": "left"},
+        {"name": "approved", "label": "Status", "field": "approved", ":format": 'value => value ? "Approved" : "Pending"'},
+    ]
+
+    def filters():
+        approved = {"Pending": False, "Approved": True}.get(status_filter.value)
+        role = None if role_filter.value == "All" else role_filter.value
+        return {"approved": approved, "role": role, "search": (search_input.value or "").strip() or None}
+
+    async def load(reset=False):
+        if reset:
+            state["after"] = None
+            table.rows.clear()
+            table.selected.clear()
+        page = await async_backend.list_users(after=state["after"], **filters())
+        table.rows.extend(page["users"])
+        table.update()
+        state["after"] = page["next_after"]
+        more_button.visible = state["after"] is not None
+
+    def selected_usernames():
+        return [row["username"] for row in table.selected]
+
+    # Rows are updated in place after a change, here or in another session
+    def show_approved(usernames):
+        hide = filters()["approved"] is False
+        for row in list(table.rows):
+            if row["username"] in usernames:
+                if hide:
+                    table.rows.remove(row)
+                else:
+                    row["approved"] = 1
+        table.selected[:] = [row for row in table.selected if row in table.rows]
+        table.update()
+
+    def show_deleted(usernames):
+        table.rows[:] = [row for row in table.rows if row["username"] not in usernames]
+        table.selected[:] = [row for row in table.selected if row["username"] not in usernames]
+        table.update()
+
+    async def show_registered(usernames):
+        f = filters()
+        shown = {row["username"] for row in table.rows}
+        for uname in usernames:
+            # New users are pending with role "user"; only add them where the current filters and pages would list them
+            if uname in shown or f["approved"] is True or f["role"] not in (None, "user"):
+                continue
+            if f["search"] and not uname.startswith(f["search"]):
+                continue
+            if state["after"] is not None and uname > state["after"]:
+                continue
+            user = await async_backend.get_user(uname)
+            if user:
+                table.rows.append(user)
+        table.rows.sort(key=lambda row: row["username"])
+        table.update()
+
+    async def on_users(change):
+        if change.get("usernames") is None:
+            await load(reset=True)
+        elif change["action"] == "approved":
+            show_approved(set(change["usernames"]))
+        elif change["action"] == "deleted":
+            show_deleted(set(change["usernames"]))
+        elif change["action"] == "registered":
+            await show_registered(change["usernames"])
+
+    async def approve_selected():
+        usernames = [row["username"] for row in table.selected if not row["approved"]]
+        if not usernames:
+            ui.notify("Select pending users to approve", color="orange")
+            return
+        await async_backend.approve_users(usernames)
+        show_approved(set(usernames))
+        table.selected.clear()
+        table.update()
+        ui.notify(f"{len(usernames)} user(s) approved", color="green")
+
+    def delete_selected():
+        usernames = [u for u in selected_usernames() if u != "admin"]
+        if not usernames:
+            ui.notify("Select users to delete (admin cannot be deleted)", color="orange")
+            return
+        dialog = ui.dialog()
+        with dialog, ui.card():
+            ui.label(f"Delete {len(usernames)} user(s)?").classes("mb-2")
+            async def confirm():
+                await async_backend.delete_users(usernames)
+                show_deleted(set(usernames))
+                table.selected.clear()
+                table.update()
+                ui.notify(f"{len(usernames)} user(s) deleted!", color="red")
+                safe_close(dialog)
+            ui.button("DELETE", on_click=confirm).classes("bg-red-500 text-white mt-2 mr-2")
+            ui.button("CANCEL", on_click=lambda: safe_close(dialog)).classes("mt-2 bg-gray-500 text-white")
+        dialog.open()
+
+    def change_pw():
+        usernames = selected_usernames()
+        if len(usernames) != 1 or usernames[0] == "admin":
+            ui.notify("Select exactly one user other than admin", color="orange")
+            return
+        uname = usernames[0]
+        dialog = ui.dialog()
+        with dialog, ui.card():
+            ui.label(f"New password for {uname}").classes("mb-2")
+            pwd_input = ui.input("New Password", password=True, password_toggle_button=True).classes("w-full")
+            async def set_pw():
+                try:
+                    await async_backend.change_password(uname, pwd_input.value)
+                except hashing.HashingBusy:
+                    notify_busy()
+                    return
+                ui.notify(f"Password changed for {uname}", color="green")
+                safe_close(dialog)
+            ui.button("SET PASSWORD", on_click=set_pw).classes("mt-2 bg-yellow-500 text-white")
+            ui.button("CANCEL", on_click=lambda: safe_close(dialog)).classes("mt-2 bg-gray-500 text-white")
+        dialog.open()
+
+    with ui.card().classes("w-full max-w-5xl mx-auto mt-10 p-6 shadow-lg"):
         ui.label("Superuser Dashboard").classes("text-2xl font-bold mb-4")
-        for u in users:
-            with ui.card().classes("w-full mb-2 p-3"):
-                ui.label(f"{u['username']} ({u['role']}) - {u['email']} | {u['phone']}")
-                if not u.get("approved"):
-                    async def approve(uname=u['username']):
-                        backend.approve_user(uname)
-                        ui.notify(f"{uname} approved", color="green")
-                        ui.navigate.to("/superuser")
-                    ui.button("Approve", on_click=approve).classes("bg-green-500 text-white")
-                if u["username"]!="admin":
-                    def change_pw(uname=u['username']):
-                        dialog = ui.dialog()
-                        with dialog, ui.card():
-                            pwd_input = ui.input("New Password", password=True, password_toggle_button=True).classes("w-full")
-                            async def set_pw():
-                                backend.change_password(uname, pwd_input.value)
-                                ui.notify(f"Password changed for {uname}", color="green")
-                                safe_close(dialog)
-                            ui.button("SET PASSWORD", on_click=set_pw).classes("mt-2 bg-yellow-500 text-white")
-                            ui.button("CANCEL", on_click=lambda: safe_close(dialog)).classes("mt-2 bg-gray-500 text-white")
-                        dialog.open()
-                    ui.button("Change Password", on_click=change_pw).classes("bg-yellow-500 text-white")
-
-                    async def delete_user(uname=u['username']):
-                        dialog = ui.dialog()
-                        with dialog, ui.card():
-                            ui.label(f"Delete {uname}?").classes("mb-2")
-                            async def confirm():
-                                backend.delete_user(uname)
-                                ui.notify(f"{uname} deleted!", color="red")
-                                safe_close(dialog)
-                                ui.navigate.to("/superuser")
-                            ui.button("DELETE", on_click=confirm).classes("bg-red-500 text-white mt-2 mr-2")
-                            ui.button("CANCEL", on_click=lambda: safe_close(dialog)).classes("mt-2 bg-gray-500 text-white")
-                        dialog.open()
-                    ui.button("Delete", on_click=delete_user).classes("bg-red-500 text-white")
+        with ui.row().classes("w-full items-end gap-4 mb-2"):
+            status_filter = ui.select(["All", "Pending", "Approved"], value="Pending", label="Status").classes("w-32")
+            role_filter = ui.select(["All", "user", "superuser"], value="All", label="Role").classes("w-32")
+            search_input = ui.input("Username starts with").classes("w-48")
+        with ui.row().classes("gap-2 mb-2"):
+            ui.button("Approve selected", on_click=approve_selected).classes("bg-green-500 text-white")
+            ui.button("Change Password", on_click=change_pw).classes("bg-yellow-500 text-white")
+            ui.button("Delete selected", on_click=delete_selected).classes("bg-red-500 text-white")
+        table = ui.table(columns=columns, rows=[], row_key="username", selection="multiple", pagination=0).classes("w-full")
+        table.props("hide-pagination")
+        more_button = ui.button("Load more", on_click=lambda: load()).classes("w-full mt-2 bg-gray-200 text-black")
+
+    status_filter.on_value_change(lambda: load(reset=True))
+    role_filter.on_value_change(lambda: load(reset=True))
+    search_input.on("keydown.enter", lambda: load(reset=True))
+    await load()
+    on_event("users", on_users)
 
     async def logout():
         await clear_jwt()
@@ -283,71 +660,10 @@ async def superuser_page():
     ui.button("Logout", on_click=logout).classes("bg-red-500 text-white")
 
 
-# -------------------------
-# Utility to parse quantities
-# -------------------------
-def parse_quantity(q):
-    q = str(q).strip()
-    try:
-        return float(Fraction(q))
-    except Exception:
-        return None
-
-
-def scale_ingredients_by_persons(text, base_persons, target_persons):
-    scaled = []
-    lines = text.strip().splitlines()
-    factor = target_persons / base_persons
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        parts = line.rsplit(' ', 2)
-        if len(parts) == 3:
-            name, qty, unit = parts
-        elif len(parts) == 2:
-            name, qty = parts
-            unit = ''
-        else:
-            continue
-
-        qty_num = parse_quantity(qty)
-        if qty_num is None:
-            continue
-        scaled_qty = qty_num * factor
-        scaled.append(f"{name} {scaled_qty:.2f} {unit}".strip())
-    return '\n'.join(scaled)
-
-
-def scale_ingredients_by_weight(text, base_weight, target_weight):
-    scaled = []
-    lines = text.strip().splitlines()
-    factor = target_weight / base_weight
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        # split last word as unit
-        parts = line.rsplit(' ', 2)
-        if len(parts) == 3:
-            name, qty, unit = parts
-        elif len(parts) == 2:
-            name, qty = parts
-            unit = ''
-        else:
-            continue
-
-        qty_num = parse_quantity(qty)
-        if qty_num is None:
-            continue
-        scaled_qty = qty_num * factor
-        scaled.append(f"{name} {scaled_qty:.2f} {unit}".strip())
-    return '\n'.join(scaled)
-
 # -------------------------
 # UI Page
 # -------------------------
-@ui.page("/calculate")
+@page("/calculate")
 def calculate_page():
     with ui.card().classes("w-96 mx-auto mt-20 p-6 shadow-lg"):
         ui.label("Ingredient Calculator").classes("text-2xl font-bold mb-4")
@@ -374,6 +690,8 @@ def calculate_page():
         # Initially hide persons inputs
         person_inputs.visible = False
 
+        normalize_units = ui.checkbox("Normalize units (g/kg, ml/l)").classes("mb-2")
+
         # Result area
         result_area = ui.textarea("Scaled Ingredients").classes("w-full")
         result_area._props["readonly"] = True
@@ -394,26 +712,103 @@ def calculate_page():
                 if scale_type.value == "By Weight":
                     base_weight = float(base_weight_input.value)
                     target_weight = float(target_weight_input.value)
-                    result = scale_ingredients_by_weight(
-                        ingredients_input.value, base_weight, target_weight
+                    result, errors = scaling.scale_ingredients_by_weight(
+                        ingredients_input.value, base_weight, target_weight, normalize_units.value
                     )
                 else:
                     base_persons = float(base_persons_input.value)
                     target_persons = float(target_persons_input.value)
-                    result = scale_ingredients_by_persons(
-                        ingredients_input.value, base_persons, target_persons
+                    result, errors = scaling.scale_ingredients_by_persons(
+                        ingredients_input.value, base_persons, target_persons, normalize_units.value
                     )
-            except (TypeError, ValueError):
+            except (TypeError, ValueError, ZeroDivisionError):
                 ui.notify("Please enter valid numbers", color="red")
                 return
 
             result_area.value = result
-            ui.notify("Ingredients scaled!", color="green")
+            if errors:
+                skipped = ", ".join(f"line {e['line']}: {e['text']}" for e in errors)
+                ui.notify(f"Could not parse {skipped}", color="orange", multi_line=True)
+            else:
+                ui.notify("Ingredients scaled!", color="green")
 
         ui.button("Calculate", on_click=calculate).classes("w-full mt-2 bg-blue-500 text-white")
         ui.button("Back to Dashboard", on_click=lambda: ui.navigate.to("/")).classes("w-full mt-2 bg-gray-500 text-white")
 
+# -------------------------
+# Startup & Health
+# -------------------------
+async def init_backend():
+    # Runs after the port is bound; keeps retrying so the app recovers once the database is reachable
+    delay = 1
+    while not await async_backend.init():
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+app.on_startup(lambda: background_tasks.create(init_backend(), name="backend-init"))
+app.on_shutdown(backend.close)
+app.on_shutdown(hashing.shutdown)
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/readyz")
+async def readyz():
+    ready = backend.is_ready() and await async_backend.check_health()
+    body = {**backend.startup, "ready": ready, "pool": backend.pool_stats()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+# -------------------------
+# Scaling API
+# -------------------------
+SCALE_MAX_JOBS = int(os.getenv("SCALE_MAX_JOBS", 10000))
+SCALE_CHUNK_SIZE = int(os.getenv("SCALE_CHUNK_SIZE", 250))
+SCALE_MAX_BODY = int(os.getenv("SCALE_MAX_BODY", 8 * 1024 * 1024))
+
+@app.post("/api/scale")
+async def scale_api(request: Request):
+    """Scale a batch of ingredient lists, like /calculate does for one.
+
+    Body: {"jobs": [{"ingredients": "Flour 500 g\\nEggs 2", "base": 4, "target": 10, "normalize": false}, ...]}
+    Returns {"results": [...]} in job order; see backend.scale_batch for the shape.
+    Jobs with more than backend.SCALE_MAX_TEXT characters of ingredients get an
+    error entry; bodies over SCALE_MAX_BODY bytes are rejected with 413.
+    """
+    # Read at most SCALE_MAX_BODY bytes, whatever Content-Length claims
+    raw = bytearray()
+    async for chunk in request.stream():
+        raw += chunk
+        if len(raw) > SCALE_MAX_BODY:
+            return JSONResponse({"error": f"request body must be at most {SCALE_MAX_BODY} bytes"}, status_code=413)
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        return JSONResponse({"error": "request body must be JSON"}, status_code=400)
+    jobs = body.get("jobs") if isinstance(body, dict) else None
+    if not isinstance(jobs, list):
+        return JSONResponse({"error": 'expected {"jobs": [...]}'}, status_code=400)
+    if len(jobs) > SCALE_MAX_JOBS:
+        return JSONResponse({"error": f"at most {SCALE_MAX_JOBS} jobs per request"}, status_code=413)
+    # Chunks run concurrently on the scaling threads
+    chunks = [jobs[i:i + SCALE_CHUNK_SIZE] for i in range(0, len(jobs), SCALE_CHUNK_SIZE)]
+    results = await asyncio.gather(*(async_backend.scale_batch(chunk) for chunk in chunks))
+    return {"results": [result for chunk in results for result in chunk]}
+
 # -------------------------
 # Run App
 # -------------------------
-ui.run(title="Recipe Manager (PostgreSQL + JWT)", port=8080, reload=False, storage_secret="super_secret_session_key_123")
\ No newline at end of file
+# Fork the hashing workers before the web server starts its threads
+hashing.start()
+# serve.py runs several of these on their own ports behind one public port
+ui.run(
+    title="Recipe Manager (PostgreSQL + JWT)",
+    host=os.getenv("HOST", "0.0.0.0"),
+    port=int(os.getenv("PORT", 8080)),
+    reload=False,
+    storage_secret=os.getenv("STORAGE_SECRET", "super_secret_session_key_123"),
+)
\ No newline at end of file
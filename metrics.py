@@ -0,0 +1,164 @@
+import bisect
+import os
+import re
+import threading
+from functools import lru_cache
+
+# ------------------------- Settings -------------------------
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_PAGE_MS = float(os.getenv("SLOW_PAGE_MS", 1000))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+
+
+# ------------------------- Metric Types -------------------------
+class Counter:
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.values = {}
+
+    def inc(self, label_value, amount=1):
+        with _lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{{{self.label}="{escape(label_value)}"}} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}  # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_value, value):
+        with _lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self.series.items()):
+            label = f'{self.label}="{escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ------------------------- Registry -------------------------
+query_latency = Histogram("db_query_duration_seconds", "Database statement latency.", "query")
+query_rows = Counter("db_query_rows_total", "Rows returned or affected by database statements.", "query")
+query_errors = Counter("db_query_errors_total", "Database statements that raised an error.", "query")
+page_latency = Histogram("page_render_duration_seconds", "Time to build a page.", "page")
+page_errors = Counter("page_errors_total", "Page handlers that raised an error.", "page")
+
+REGISTRY = [query_latency, query_rows, query_errors, page_latency, page_errors]
+
+# Callables returning (name, type, help, value) samples read at scrape time,
+# e.g. pool and cache stats. type is "gauge" or "counter"; counters only
+# grow and their names end in _total.
+sources = []
+
+
+def cache_samples(prefix, stats):
+    """Samples for a TTLCache's stats(): its size and its hit, miss and eviction counters."""
+    return [
+        (prefix + "_size", "gauge", "Entries in the cache.", stats["size"]),
+        (prefix + "_hits_total", "counter", "Lookups that found a live entry.", stats["hits"]),
+        (prefix + "_misses_total", "counter", "Lookups that found no live entry.", stats["misses"]),
+        (prefix + "_evictions_total", "counter", "Entries evicted to stay within the size limit.", stats["evictions"]),
+    ]
+
+
+# ------------------------- SQL Normalization -------------------------
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_ARRAY = re.compile(r"ARRAY\[[^\]]*\]")
+_SPACE = re.compile(r"\s+")
+
+
+# Longer statements are normalized without caching: execute_values inlines
+# row data, so bulk INSERTs are large and never repeat
+NORMALIZE_CACHE_MAX_LEN = 4096
+
+
+def normalize_sql(query):
+    """Collapse a statement to its shape: literals and placeholders become ?,
+    multi-row VALUES lists, IN lists and arrays collapse, whitespace is squeezed."""
+    if len(query) < NORMALIZE_CACHE_MAX_LEN:
+        return _normalize_cached(query)
+    return _normalize(query)
+
+
+@lru_cache(maxsize=2048)
+def _normalize_cached(query):
+    return _normalize(query)
+
+
+def _normalize(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = _STRING.sub("?", query)
+    query = _PLACEHOLDER.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    query = _ARRAY.sub("ARRAY[...]", query)
+    query = _VALUE_LIST.sub("(...)", query)
+    query = _IN_LIST.sub("IN (...)", query)
+    return _SPACE.sub(" ", query).strip()
+
+
+# ------------------------- Hooks -------------------------
+def record_query(query, duration, rowcount, error):
+    sql = normalize_sql(query)
+    query_latency.observe(sql, duration)
+    if error is not None:
+        query_errors.inc(sql)
+    elif rowcount and rowcount > 0:
+        query_rows.inc(sql, rowcount)
+    if duration * 1000 >= SLOW_QUERY_MS:
+        print(f"Slow query ({duration * 1000:.1f} ms, {rowcount} rows): {sql}")
+
+
+def record_page(page, duration, error):
+    page_latency.observe(page, duration)
+    if error is not None:
+        page_errors.inc(page)
+    if duration * 1000 >= SLOW_PAGE_MS:
+        print(f"Slow page ({duration * 1000:.1f} ms): {page}")
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+    for source in sources:
+        for name, kind, help_text, value in source():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,337 @@
+# ------------------------- Schema Migrations -------------------------
+# Each migration is (version, name, statements). Versions are applied in order,
+# each in its own transaction, and recorded in schema_migrations. Never edit a
+# migration that has shipped; append a new one instead.
+
+MIGRATIONS = [
+    (1, "initial tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            name TEXT,
+            email TEXT,
+            phone TEXT,
+            role TEXT,
+            approved INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS recipes (
+            id SERIAL PRIMARY KEY,
+            username TEXT,
+            title TEXT,
+            content TEXT,
+            FOREIGN KEY(username) REFERENCES users(username)
+        )
+        """,
+    ]),
+    (2, "user and recipe constraints", [
+        "UPDATE users SET role='user' WHERE role IS NULL",
+        "UPDATE users SET approved=0 WHERE approved IS NULL",
+        "ALTER TABLE users ALTER COLUMN role SET DEFAULT 'user', ALTER COLUMN role SET NOT NULL",
+        "ALTER TABLE users ALTER COLUMN approved SET DEFAULT 0, ALTER COLUMN approved SET NOT NULL",
+        # Rows without an owner are unreachable from the app
+        "DELETE FROM recipes WHERE username IS NULL",
+        "UPDATE recipes SET title='Untitled' WHERE title IS NULL",
+        "UPDATE recipes SET content='' WHERE content IS NULL",
+        # Titles become unique per user; keep the oldest and suffix later duplicates with their id
+        """
+        UPDATE recipes r SET title = r.title || ' (' || r.id || ')'
+        WHERE EXISTS (
+            SELECT 1 FROM recipes o
+            WHERE o.username = r.username AND o.title = r.title AND o.id < r.id
+        )
+        """,
+        """
+        ALTER TABLE recipes
+            ALTER COLUMN username SET NOT NULL,
+            ALTER COLUMN title SET NOT NULL,
+            ALTER COLUMN content SET NOT NULL,
+            ALTER COLUMN content SET DEFAULT ''
+        """,
+        # Deleting a user removes their recipes instead of failing on the foreign key
+        "ALTER TABLE recipes DROP CONSTRAINT IF EXISTS recipes_username_fkey",
+        """
+        ALTER TABLE recipes ADD CONSTRAINT recipes_username_fkey
+            FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
+        """,
+        # Backs per-user listings (leading column) and title lookups
+        "ALTER TABLE recipes ADD CONSTRAINT recipes_username_title_key UNIQUE (username, title)",
+    ]),
+    (3, "recipe full-text search", [
+        # Maintained by Postgres on every insert/update; titles rank above bodies
+        """
+        ALTER TABLE recipes ADD COLUMN search tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A') ||
+            setweight(to_tsvector('english', content), 'B')
+        ) STORED
+        """,
+        "CREATE INDEX recipes_search_idx ON recipes USING GIN (search)",
+    ]),
+    (4, "structured recipe ingredients", [
+        # Parsed from the recipe body on every write; quantity is in the base
+        # unit (g, ml, or the written unit when it is not convertible)
+        """
+        CREATE TABLE recipe_ingredients (
+            recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            quantity DOUBLE PRECISION NOT NULL,
+            unit TEXT NOT NULL,
+            written_unit TEXT NOT NULL,
+            PRIMARY KEY (recipe_id, position)
+        )
+        """,
+        "CREATE INDEX recipe_ingredients_name_idx ON recipe_ingredients (lower(name) text_pattern_ops)",
+    ]),
+    (5, "user listing index", [
+        # Serves the admin listing filtered by approval state and role, paged by username
+        "CREATE INDEX users_approved_role_username_idx ON users (approved, role, username)",
+    ]),
+    (6, "rendered recipe html", [
+        # Optional persisted markdown rendering; rendered_hash is the hash of
+        # the content it was rendered from, so a stale copy is never served
+        "ALTER TABLE recipes ADD COLUMN rendered_html TEXT, ADD COLUMN rendered_hash TEXT",
+    ]),
+    (7, "login sessions", [
+        # Browser session id -> JWT, shared by every app worker
+        """
+        CREATE TABLE sessions (
+            id TEXT PRIMARY KEY,
+            token TEXT NOT NULL,
+            expires_at DOUBLE PRECISION NOT NULL
+        )
+        """,
+        "CREATE INDEX sessions_expires_at_idx ON sessions (expires_at)",
+    ]),
+    (8, "code point order for keyset pages", [
+        # Pages are read in code point order (Storage.code_point) so the live
+        # views can place rows by comparing strings; the database collation
+        # (e.g. en_US) would put "apple" before "Banana"
+        'CREATE INDEX recipes_username_title_c_idx ON recipes (username, title COLLATE "C")',
+        'CREATE INDEX users_username_c_idx ON users (username COLLATE "C")',
+        "DROP INDEX users_approved_role_username_idx",
+        'CREATE INDEX users_approved_role_username_idx ON users (approved, role, username COLLATE "C")',
+    ]),
+]
+
+# The embedded database starts from the current schema, so its history begins
+# at version 1 and grows independently of the Postgres one. Version 1 also
+# adopts files made by the original app (data/app.db): SQLite cannot add
+# constraints to a table, so users and recipes are rebuilt from whatever is
+# there, cleaned up like Postgres migration 2 does.
+SQLITE_MIGRATIONS = [
+    (1, "initial schema", [
+        # The original tables, so a new file and a legacy one take the same path
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            name TEXT,
+            email TEXT,
+            phone TEXT,
+            role TEXT,
+            approved INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            title TEXT,
+            content TEXT,
+            FOREIGN KEY(username) REFERENCES users(username)
+        )
+        """,
+        # Renaming users also repoints the foreign key of legacy_recipes, so
+        # nothing references the new users table when the old ones are dropped
+        "ALTER TABLE recipes RENAME TO legacy_recipes",
+        "ALTER TABLE users RENAME TO legacy_users",
+        """
+        CREATE TABLE users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            name TEXT,
+            email TEXT,
+            phone TEXT,
+            role TEXT NOT NULL DEFAULT 'user',
+            approved INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE recipes (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL DEFAULT '',
+            UNIQUE (username, title)
+        )
+        """,
+        """
+        INSERT INTO users (username, password, name, email, phone, role, approved)
+        SELECT username, password, name, email, phone, coalesce(role, 'user'), coalesce(approved, 0)
+        FROM legacy_users
+        """,
+        # Rows without a (known) owner are unreachable from the app. Titles
+        # become unique per user; the oldest keeps its title and later
+        # duplicates are suffixed with their id
+        """
+        INSERT INTO recipes (id, username, title, content)
+        SELECT r.id, r.username,
+               CASE WHEN EXISTS (
+                   SELECT 1 FROM legacy_recipes o
+                   WHERE o.username = r.username AND coalesce(o.title, 'Untitled') = coalesce(r.title, 'Untitled')
+                     AND o.id < r.id
+               ) THEN coalesce(r.title, 'Untitled') || ' (' || r.id || ')' ELSE coalesce(r.title, 'Untitled') END,
+               coalesce(r.content, '')
+        FROM legacy_recipes r
+        WHERE r.username IN (SELECT username FROM users)
+        ORDER BY r.id
+        """,
+        "DROP TABLE legacy_recipes",
+        "DROP TABLE legacy_users",
+        """
+        CREATE TABLE recipe_ingredients (
+            recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            unit TEXT NOT NULL,
+            written_unit TEXT NOT NULL,
+            PRIMARY KEY (recipe_id, position)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX recipe_ingredients_name_idx ON recipe_ingredients (lower(name))",
+        "CREATE INDEX users_approved_role_username_idx ON users (approved, role, username)",
+        # External-content FTS5 index over title and body, kept in sync by triggers
+        """
+        CREATE VIRTUAL TABLE recipes_fts USING fts5(
+            title, content, content='recipes', content_rowid='id', tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER recipes_fts_insert AFTER INSERT ON recipes BEGIN
+            INSERT INTO recipes_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER recipes_fts_delete AFTER DELETE ON recipes BEGIN
+            INSERT INTO recipes_fts (recipes_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER recipes_fts_update AFTER UPDATE OF title, content ON recipes BEGIN
+            INSERT INTO recipes_fts (recipes_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO recipes_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+        """,
+        # Index recipes adopted from a legacy file; the triggers cover new writes
+        "INSERT INTO recipes_fts (recipes_fts) VALUES ('rebuild')",
+    ]),
+    (2, "rendered recipe html", [
+        "ALTER TABLE recipes ADD COLUMN rendered_html TEXT",
+        "ALTER TABLE recipes ADD COLUMN rendered_hash TEXT",
+    ]),
+    (3, "login sessions", [
+        """
+        CREATE TABLE sessions (
+            id TEXT PRIMARY KEY,
+            token TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX sessions_expires_at_idx ON sessions (expires_at)",
+    ]),
+]
+
+DIALECTS = {"postgres": MIGRATIONS, "sqlite": SQLITE_MIGRATIONS}
+
+# The migration that creates recipe_ingredients; recipes saved before it are
+# parsed into it once it has been applied (Storage.migrate)
+INGREDIENTS_VERSION = {"postgres": 4, "sqlite": 1}
+
+# Arbitrary key for pg_advisory_lock so concurrent app starts migrate one at a time
+MIGRATION_LOCK_ID = 0x5245_4349
+
+
+def latest_version(dialect="postgres"):
+    return DIALECTS[dialect][-1][0]
+
+
+def schema_version(conn, dialect="postgres"):
+    # Highest applied version, 0 for a database that has never been migrated
+    if dialect == "sqlite":
+        exists = "SELECT count(*) FROM sqlite_master WHERE type='table' AND name='schema_migrations'"
+    else:
+        exists = "SELECT to_regclass('schema_migrations') IS NOT NULL"
+    with conn.cursor() as cur:
+        cur.execute(exists)
+        if not cur.fetchone()[0]:
+            version = 0
+        else:
+            cur.execute("SELECT coalesce(max(version), 0) FROM schema_migrations")
+            version = cur.fetchone()[0]
+    conn.commit()
+    return version
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def migrate(conn, dialect="postgres"):
+    """Apply pending migrations on ``conn`` and return the versions applied."""
+    sqlite = dialect == "sqlite"
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        conn.commit()
+        if not sqlite:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    applied = []
+    try:
+        done = applied_versions(conn)
+        for version, name, statements in DIALECTS[dialect]:
+            if version in done:
+                continue
+            try:
+                with conn.cursor() as cur:
+                    if sqlite:
+                        # SQLite has no advisory locks: take the write lock
+                        # first and re-check, another process may have won
+                        cur.execute("BEGIN IMMEDIATE")
+                        cur.execute("SELECT 1 FROM schema_migrations WHERE version=%s", (version,))
+                        if cur.fetchone():
+                            conn.commit()
+                            continue
+                    for statement in statements:
+                        cur.execute(statement)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Applied migration {version}: {name}")
+            applied.append(version)
+    finally:
+        if not sqlite:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
@@ -0,0 +1,27 @@
+import hashlib
+
+import markdown2
+
+# The extras ui.markdown enables by default, so cached HTML looks the same
+MARKDOWN_EXTRAS = ["fenced-code-blocks", "tables"]
+
+
+def content_hash(content):
+    return hashlib.blake2b((content or "").encode(), digest_size=16).hexdigest()
+
+
+def _remove_indentation(text):
+    # Same rule as ui.markdown: dedent by the first non-empty line
+    lines = text.splitlines()
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    if not lines:
+        return ""
+    indentation = len(lines[0]) - len(lines[0].lstrip())
+    return "\n".join(line[indentation:] for line in lines)
+
+
+def render_markdown(content):
+    """Render recipe markdown to HTML. The result is not sanitized; display it
+    with ui.html(..., sanitize=True) like ui.markdown does."""
+    return markdown2.markdown(_remove_indentation(content or ""), extras=MARKDOWN_EXTRAS)
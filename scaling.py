@@ -0,0 +1,219 @@
+import math
+import re
+from fractions import Fraction
+
+import numpy as np
+
+# ------------------------- Units -------------------------
+# Written unit -> (dimension, size in the dimension's base unit)
+UNITS = {
+    "mg": ("mass", 0.001),
+    "g": ("mass", 1.0), "gram": ("mass", 1.0), "grams": ("mass", 1.0),
+    "kg": ("mass", 1000.0), "kilogram": ("mass", 1000.0), "kilograms": ("mass", 1000.0),
+    "ml": ("volume", 1.0), "milliliter": ("volume", 1.0), "milliliters": ("volume", 1.0),
+    "millilitre": ("volume", 1.0), "millilitres": ("volume", 1.0),
+    "l": ("volume", 1000.0), "liter": ("volume", 1000.0), "liters": ("volume", 1000.0),
+    "litre": ("volume", 1000.0), "litres": ("volume", 1000.0),
+    "tsp": ("volume", 4.92892), "teaspoon": ("volume", 4.92892), "teaspoons": ("volume", 4.92892),
+    "tbsp": ("volume", 14.7868), "tablespoon": ("volume", 14.7868), "tablespoons": ("volume", 14.7868),
+    "cup": ("volume", 236.588), "cups": ("volume", 236.588),
+}
+
+# Dimension -> [(threshold, unit, size)], largest first, used when normalizing output
+DISPLAY_UNITS = {
+    "mass": [(1000.0, "kg", 1000.0), (0.0, "g", 1.0)],
+    "volume": [(1000.0, "l", 1000.0), (0.0, "ml", 1.0)],
+}
+
+# A bulleted markdown list item: "- Flour 200 g", "* Eggs 2", ...
+_LIST_ITEM = re.compile(r"^\s*[-*+•]\s+")
+
+UNICODE_FRACTIONS = {"½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4", "⅛": "1/8"}
+
+
+def parse_quantity(q):
+    # None unless q is a finite number; "1e400" does not fit in a float
+    q = UNICODE_FRACTIONS.get(str(q).strip(), str(q).strip())
+    try:
+        value = float(Fraction(q))
+    except (ValueError, ZeroDivisionError, OverflowError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def lookup_unit(unit):
+    return UNITS.get(unit.lower().rstrip("."))
+
+
+# ------------------------- Parsed Form -------------------------
+class ParsedIngredients:
+    """Ingredient list parsed once into parallel arrays.
+
+    ``quantities`` holds amounts in each line's base unit (g, ml, or the
+    written unit when it is not a known one) and ``unit_sizes`` converts them
+    back to the unit as written. Lines that could not be parsed are kept in
+    ``errors`` as ``{"line": number, "text": line}``.
+    """
+
+    __slots__ = ("names", "units", "dimensions", "quantities", "unit_sizes", "errors")
+
+    def __init__(self, names, units, dimensions, quantities, unit_sizes, errors):
+        self.names = names
+        self.units = units
+        self.dimensions = dimensions
+        self.quantities = quantities
+        self.unit_sizes = unit_sizes
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.names)
+
+
+def parse_line(line):
+    # Accepts "Name qty unit" and "Name qty"; the name may contain spaces
+    tokens = line.split()
+    if len(tokens) >= 2:
+        qty = parse_quantity(tokens[-1])
+        if qty is not None:
+            return " ".join(tokens[:-1]), qty, ""
+    if len(tokens) >= 3:
+        qty = parse_quantity(tokens[-2])
+        if qty is not None:
+            return " ".join(tokens[:-2]), qty, tokens[-1]
+    return None
+
+
+def normalize_text(text):
+    """Ingredient text reduced to what parse() reads: runs of whitespace become
+    one space and trailing blank lines go. Blank lines in between stay so
+    error line numbers still match."""
+    return "\n".join(" ".join(line.split()) for line in (text or "").splitlines()).rstrip("\n")
+
+
+def parse(text):
+    names, units, dimensions, quantities, unit_sizes, errors = [], [], [], [], [], []
+    for number, line in enumerate((text or "").splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        parsed = parse_line(line)
+        if parsed is None:
+            errors.append({"line": number, "text": line})
+            continue
+        name, qty, unit = parsed
+        dimension, size = lookup_unit(unit) or (None, 1.0)
+        names.append(name)
+        units.append(unit)
+        dimensions.append(dimension)
+        quantities.append(qty * size)
+        unit_sizes.append(size)
+    return ParsedIngredients(
+        names, units, dimensions,
+        np.asarray(quantities, dtype=np.float64),
+        np.asarray(unit_sizes, dtype=np.float64),
+        errors,
+    )
+
+
+def extract_ingredients(content):
+    """Return the ingredient lines of a recipe body.
+
+    If the markdown has an "Ingredients" heading the lines up to the next
+    heading are used. Without one only bulleted list items are, so steps
+    like "Preheat oven to 180 C" in a free-text body are not read as
+    ingredients. List markers are stripped either way.
+    """
+    lines = (content or "").splitlines()
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith("#") and line.strip("# ").lower().startswith("ingredient"):
+            section = []
+            for rest in lines[i + 1:]:
+                if rest.lstrip().startswith("#"):
+                    break
+                section.append(rest)
+            return "\n".join(line.strip().lstrip("-*+• ").strip() for line in section)
+    return "\n".join(_LIST_ITEM.sub("", line).strip() for line in lines if _LIST_ITEM.match(line))
+
+
+def base_unit(dimension, unit):
+    return DISPLAY_UNITS[dimension][-1][1] if dimension else unit
+
+
+# ------------------------- Scaling -------------------------
+def scale(parsed, factors):
+    """Scale one parsed list by many factors: returns an array of shape (len(factors), len(parsed))."""
+    return np.outer(np.asarray(factors, dtype=np.float64), parsed.quantities)
+
+
+def scale_many(parsed_list, factors):
+    """Scale many parsed lists, each by its own factor, in one pass.
+
+    Products too large for a float come out as inf; see all_finite().
+    """
+    if not parsed_list:
+        return []
+    lengths = [len(p) for p in parsed_list]
+    quantities = np.concatenate([p.quantities for p in parsed_list])
+    with np.errstate(over="ignore"):
+        scaled = quantities * np.repeat(np.asarray(factors, dtype=np.float64), lengths)
+    return np.split(scaled, np.cumsum(lengths)[:-1])
+
+
+def all_finite(quantities):
+    return bool(np.isfinite(quantities).all())
+
+
+def format_line(name, quantity, unit):
+    return f"{name} {quantity:.2f} {unit}".strip()
+
+
+def display_quantity(quantity, unit, normalize=False):
+    """``(quantity, unit)`` to show for a base-unit ``quantity`` of an ingredient written in ``unit``."""
+    dimension, size = lookup_unit(unit) or (None, 1.0)
+    if normalize and dimension:
+        for threshold, display_unit, display_size in DISPLAY_UNITS[dimension]:
+            if abs(quantity) >= threshold:
+                return quantity / display_size, display_unit
+    return quantity / size, unit
+
+
+def format_ingredient(name, quantity, unit, normalize=False):
+    """Format one base-unit ``quantity`` of an ingredient written in ``unit``."""
+    return format_line(name, *display_quantity(quantity, unit, normalize))
+
+
+def items(parsed, quantities, normalize=False):
+    """Scaled base-unit quantities as ``(name, quantity, unit)`` in display units.
+
+    By default amounts are shown in the unit each line was written in; with
+    ``normalize`` known units are converted to g/kg or ml/l.
+    """
+    if normalize:
+        return [(n, *display_quantity(q, u, normalize)) for n, q, u in zip(parsed.names, quantities.tolist(), parsed.units)]
+    written = (quantities / parsed.unit_sizes).tolist()
+    return list(zip(parsed.names, written, parsed.units))
+
+
+def render(parsed, quantities, normalize=False):
+    """Format scaled base-unit quantities as text, one ingredient per line (see items())."""
+    return "\n".join(format_line(n, q, u) for n, q, u in items(parsed, quantities, normalize))
+
+
+def scale_text(text, factor, normalize=False):
+    """Scale ingredient text by ``factor``; returns ``(scaled_text, errors)``."""
+    parsed = parse(text)
+    return render(parsed, parsed.quantities * factor, normalize), parsed.errors
+
+
+def scale_text_batch(text, factors, normalize=False):
+    """Scale ingredient text to several sizes at once; returns ``([scaled_text, ...], errors)``."""
+    parsed = parse(text)
+    return [render(parsed, row, normalize) for row in scale(parsed, factors)], parsed.errors
+
+
+def scale_ingredients_by_persons(text, base_persons, target_persons, normalize=False):
+    return scale_text(text, target_persons / base_persons, normalize)
+
+
+def scale_ingredients_by_weight(text, base_weight, target_weight, normalize=False):
+    return scale_text(text, target_weight / base_weight, normalize)
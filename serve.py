@@ -0,0 +1,161 @@
+"""Run several app workers behind one port.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8080]
+
+Each worker is frontend.py on its own port (PORT+1 ... PORT+N). Clients
+must stick to one worker, because NiceGUI keeps a page's state in the process
+that built it and its websocket has to reach that process. Logins live in the
+session store (sessions.py), so with SESSION_BACKEND=database a client that
+lands on another worker after a restart stays logged in.
+
+The recommended setup is --no-proxy behind a load balancer (nginx, HAProxy,
+a cloud balancer) with sticky sessions, e.g. by cookie, pointed at the worker
+ports. Without --no-proxy a built-in TCP proxy listens on PORT. It is meant
+for trying things out on one machine:
+
+- it is a single Python asyncio process that relays every byte of every
+  client, so it can become the bottleneck before the workers do;
+- it picks the worker by hashing the client IP, so everyone behind one NAT
+  or upstream proxy lands on the same worker.
+
+/metrics is per worker; scrape the worker ports directly.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY = 2.0
+
+
+# ------------------------- Workers -------------------------
+class Worker:
+    def __init__(self, index, host, port, env):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.env = env
+        self.process = None
+        self.started = 0.0
+
+    def start(self):
+        env = dict(self.env, HOST=self.host, PORT=str(self.port))
+        self.process = subprocess.Popen([sys.executable, os.path.join(HERE, "frontend.py")], cwd=HERE, env=env)
+        self.started = time.monotonic()
+        print(f"worker {self.index} started on port {self.port} (pid {self.process.pid})")
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.alive():
+            self.process.terminate()
+
+    def wait(self, timeout):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def worker_env(workers):
+    env = dict(os.environ)
+    # Split the bcrypt processes between workers instead of each forking one per core
+    env.setdefault("HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+    return env
+
+
+async def supervise(workers):
+    # Restart workers that exited, but not in a tight loop
+    while True:
+        await asyncio.sleep(1)
+        for worker in workers:
+            if not worker.alive() and time.monotonic() - worker.started >= RESTART_DELAY:
+                print(f"worker {worker.index} exited with {worker.process.returncode}, restarting")
+                worker.start()
+
+
+# ------------------------- Sticky Proxy -------------------------
+async def pipe(reader, writer):
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+def make_handler(workers):
+    async def handle(client_reader, client_writer):
+        peer = client_writer.get_extra_info("peername")
+        host = peer[0] if peer else ""
+        first = zlib.crc32(host.encode()) % len(workers)
+        # The client's own worker, or the next live one while it restarts
+        for offset in range(len(workers)):
+            worker = workers[(first + offset) % len(workers)]
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+                break
+            except OSError:
+                continue
+        else:
+            client_writer.close()
+            return
+        await asyncio.gather(pipe(client_reader, upstream_writer), pipe(upstream_reader, client_writer))
+    return handle
+
+
+# ------------------------- Runner -------------------------
+async def run(args):
+    # Behind the proxy the workers only need to be reachable from this host
+    worker_host = args.host if args.no_proxy else "127.0.0.1"
+    workers = [Worker(i, worker_host, args.port + 1 + i, worker_env(args.workers)) for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = None
+    if not args.no_proxy:
+        server = await asyncio.start_server(make_handler(workers), args.host, args.port)
+        print(f"serving {args.workers} workers on http://{args.host}:{args.port}")
+        print("the built-in proxy is one process and routes by client IP; "
+              "use --no-proxy behind a sticky load balancer in production")
+    supervisor = asyncio.create_task(supervise(workers))
+    try:
+        await stop.wait()
+    finally:
+        supervisor.cancel()
+        if server:
+            server.close()
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.wait(10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the recipe app on several worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8080)))
+    parser.add_argument("--no-proxy", action="store_true", help="only run the workers, for a sticky load balancer (recommended)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
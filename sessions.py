@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import backend
+from cache import TTLCache
+
+# ------------------------- Settings -------------------------
+# "database": the sessions table, shared by every worker on the same database.
+# "memory": this process only; enough for one worker or workers behind sticky
+# routing (serve.py), but logins are lost on restart.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "database")
+SESSION_TTL = backend.JWT_EXPIRATION_MINUTES * 60
+SESSION_MEMORY_SIZE = int(os.getenv("SESSION_MEMORY_SIZE", 100000))
+# Expired rows are deleted at most this often, piggybacking on logins
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", 600))
+# Database sessions loaded in the last SESSION_CACHE_TTL seconds are served
+# from memory, so page views skip the round trip. A logout on another worker
+# takes up to this long to reach this one; 0 disables the cache.
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 30))
+
+
+# ------------------------- Session Stores -------------------------
+# A store maps a browser session id (app.storage.browser["id"]) to the JWT
+# issued at login. Methods are blocking; the pages call them through
+# async_backend.
+class MemorySessionStore:
+    def __init__(self, ttl=SESSION_TTL, maxsize=SESSION_MEMORY_SIZE):
+        self._sessions = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, session_id):
+        return self._sessions.get(session_id)
+
+    def save(self, session_id, token):
+        self._sessions.set(session_id, token)
+        return True
+
+    def delete(self, session_id):
+        self._sessions.pop(session_id)
+
+
+class DatabaseSessionStore:
+    def __init__(self, ttl=SESSION_TTL, purge_interval=SESSION_PURGE_INTERVAL,
+                 cache_ttl=SESSION_CACHE_TTL, cache_size=SESSION_MEMORY_SIZE):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl > 0 else None
+
+    def load(self, session_id):
+        if self._cache:
+            token = self._cache.get(session_id)
+            if token is not None:
+                return token
+        token = backend.get_session(session_id)
+        if token and self._cache:
+            self._cache.set(session_id, token)
+        return token
+
+    def save(self, session_id, token):
+        saved = backend.save_session(session_id, token, self.ttl)
+        if self._cache:
+            if saved:
+                self._cache.set(session_id, token)
+            else:
+                self._cache.pop(session_id)
+        with self._lock:
+            purge = time.monotonic() >= self._next_purge
+            if purge:
+                self._next_purge = time.monotonic() + self.purge_interval
+        if purge:
+            backend.purge_sessions()
+        return saved
+
+    def delete(self, session_id):
+        if self._cache:
+            self._cache.pop(session_id)
+        backend.delete_session(session_id)
+
+
+STORES = {"memory": MemorySessionStore, "database": DatabaseSessionStore}
+
+if SESSION_BACKEND not in STORES:
+    raise ValueError("SESSION_BACKEND must be one of: " + ", ".join(STORES))
+store = STORES[SESSION_BACKEND]()
+
+
+def load(session_id):
+    return store.load(session_id)
+
+
+def save(session_id, token):
+    return store.save(session_id, token)
+
+
+def delete(session_id):
+    store.delete(session_id)
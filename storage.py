@@ -0,0 +1,754 @@
+import json
+import os
+import re
+import select
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+
+import migrations
+import scaling
+from db import (ConnectionPool, InstrumentedCursor, PreparingConnection, SqliteConnection, is_disconnect,
+                numbered_query)
+
+# ------------------------- Settings -------------------------
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Compiled statements kept per SQLite connection
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", 256))
+# Server-side prepared statements on Postgres; turn off behind a pooler in
+# transaction mode (e.g. PgBouncer), where sessions are shared
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") == "1"
+# Rows per multi-row INSERT statement
+BULK_PAGE_SIZE = 1000
+# How often the notification listener wakes up to check for close(), and how
+# long it waits before reconnecting after an error
+LISTEN_POLL_INTERVAL = 5.0
+LISTEN_RETRY_DELAY = 5.0
+
+
+def open_storage(url, connect_timeout=10, **pool_settings):
+    """Storage for ``url``: ``sqlite:///relative/path.db``, ``sqlite:////absolute/path.db``
+    or a Postgres DSN. ``pool_settings`` are passed to the ConnectionPool."""
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        if path.startswith("///"):
+            path = path[3:]
+        return SqliteStorage(path, connect_timeout=connect_timeout, **pool_settings)
+    return PostgresStorage(url, connect_timeout=connect_timeout, **pool_settings)
+
+
+def ingredient_rows(recipe_id, content):
+    parsed = scaling.parse(scaling.extract_ingredients(content))
+    return [
+        (recipe_id, position, name, float(qty), scaling.base_unit(dimension, unit), unit)
+        for position, (name, unit, dimension, qty) in enumerate(
+            zip(parsed.names, parsed.units, parsed.dimensions, parsed.quantities))
+    ]
+
+
+# Profile columns, without the password hash
+USER_FIELDS = ("username", "name", "email", "phone", "role", "approved")
+USER_COLUMNS = ",".join(USER_FIELDS)
+RECIPE_FIELDS = ("id", "username", "title", "content")
+RECIPE_COLUMNS = ",".join(RECIPE_FIELDS)
+# Recipe pages and lists
+RECIPE_SUMMARY_FIELDS = ("id", "title")
+RECIPE_SUMMARY_COLUMNS = ",".join(RECIPE_SUMMARY_FIELDS)
+# Rows of search_recipes() and ingredients(), whose columns are expressions
+SEARCH_FIELDS = ("id", "title", "rank", "snippet")
+INGREDIENT_FIELDS = ("name", "quantity", "unit", "written_unit")
+
+# ------------------------- Hot Statements -------------------------
+# Reads that run on nearly every request, executed by name through
+# Storage.prepared(). Postgres parses and plans each one once per connection.
+# {code_point} is filled in with Storage.code_point.
+STATEMENTS = {
+    "user_exists": "SELECT 1 FROM users WHERE username=%s",
+    "user_login": "SELECT password,role,approved FROM users WHERE username=%s",
+    "user_profile": "SELECT " + USER_COLUMNS + " FROM users WHERE username=%s",
+    "session_token": "SELECT token FROM sessions WHERE id=%s AND expires_at>%s",
+    "recipes": "SELECT " + RECIPE_COLUMNS + " FROM recipes WHERE username=%s",
+    "recipe_page": "SELECT " + RECIPE_SUMMARY_COLUMNS
+                   + " FROM recipes WHERE username=%s ORDER BY title{code_point} LIMIT %s",
+    "recipe_page_after": "SELECT " + RECIPE_SUMMARY_COLUMNS + """
+        FROM recipes WHERE username=%s AND title{code_point}>%s
+        ORDER BY title{code_point} LIMIT %s
+    """,
+    "recipe": "SELECT " + RECIPE_COLUMNS + " FROM recipes WHERE id=%s AND username=%s",
+    "recipe_rendered": "SELECT id,title,content,rendered_html,rendered_hash FROM recipes WHERE id=%s AND username=%s",
+    # INGREDIENT_FIELDS
+    "ingredients": """
+        SELECT i.name, i.quantity * %s, i.unit, i.written_unit
+        FROM recipe_ingredients i JOIN recipes r ON r.id = i.recipe_id
+        WHERE r.id=%s AND r.username=%s
+        ORDER BY i.position
+    """,
+}
+
+
+def like_prefix(prefix):
+    # LIKE pattern matching values that start with ``prefix`` literally;
+    # used with Storage.like_escape
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def fetch_result(cur, fetch):
+    if fetch == "one":
+        return cur.fetchone()
+    if fetch == "all":
+        return cur.fetchall()
+    return cur.rowcount
+
+
+# ------------------------- Storage Interface -------------------------
+class Storage(ABC):
+    """Data access behind the backend functions.
+
+    Methods take and return plain values and row tuples; hashing, caching and
+    shaping results stay in backend. Queries shared by both databases are
+    written once here with %s placeholders, subclasses open the connections
+    and implement the abstract methods for the statements that differ.
+    """
+
+    dialect = None
+    # Appended to LIKE so a backslash escapes % and _ on both databases
+    like_escape = ""
+    # Appended to text in keyset ORDER BY and comparisons, so pages sort by
+    # code point like the str comparisons the live views place rows with;
+    # SQLite's default BINARY collation already does
+    code_point = ""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._tx = threading.local()
+        # Set by migrate() when recipes saved before recipe_ingredients
+        # existed are left to backfill_ingredients()
+        self.needs_backfill = False
+
+    def close(self):
+        self.pool.closeall()
+
+    def stats(self):
+        return self.pool.stats()
+
+    def is_disconnect(self, error):
+        return False
+
+    def migrate(self):
+        # Up-to-date schemas cost one query; DDL only runs when behind
+        applied = []
+        with self.pool.connection() as conn:
+            version = migrations.schema_version(conn, self.dialect)
+            if version < migrations.latest_version(self.dialect):
+                applied = migrations.migrate(conn, self.dialect)
+                version = migrations.schema_version(conn, self.dialect)
+        if migrations.INGREDIENTS_VERSION[self.dialect] in applied:
+            self.needs_backfill = True
+        return version
+
+    # ------------------------- Transactions -------------------------
+    def execute(self, query, params=None, fetch=None):
+        """Run one statement on a pooled connection and commit it.
+
+        ``fetch`` selects the result: ``"one"`` or ``"all"`` rows, otherwise the
+        affected row count. Returns None on error.
+        """
+        def work(cur):
+            cur.execute(query, params or ())
+            return fetch_result(cur, fetch)
+        return self.run(work)
+
+    def prepared(self, name, params=(), fetch=None):
+        """Like execute() for the statement ``name`` in STATEMENTS, which
+        subclasses may keep prepared on the server."""
+        return self.execute(self.statement(name), params, fetch)
+
+    def statement(self, name):
+        return STATEMENTS[name].format(code_point=self.code_point)
+
+    def run(self, work):
+        """Call ``work(cursor)`` on one pooled connection and commit once.
+
+        Returns what ``work`` returns, or None on error. The whole unit is
+        retried once if the connection dropped before the commit was sent; a
+        failed commit is not retried, as the server may have committed it.
+        A dropped connection also closes the idle ones checked in before it,
+        so the retry does not pick up another connection to the same dead
+        server.
+        Inside ``transaction()`` the work joins the open transaction instead
+        and errors propagate so the whole unit rolls back.
+        """
+        conn = getattr(self._tx, "conn", None)
+        if conn is not None:
+            with conn.cursor() as cur:
+                return work(cur)
+        for attempt in range(2):
+            committing = False
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        result = work(cur)
+                    committing = True
+                    conn.commit()
+                    return result
+            except Exception as e:
+                dropped = self.is_disconnect(e)
+                if dropped:
+                    self.pool.discard_idle(time.monotonic())
+                if attempt == 0 and not committing and dropped:
+                    print("DB connection lost, retrying:", e)
+                    continue
+                print("DB Error:", e)
+                return None
+
+    @contextmanager
+    def transaction(self):
+        """Group calls made in this thread into one transaction and commit.
+
+        Nested blocks join the outermost one. Callbacks registered with
+        after_commit run only once the commit succeeded.
+        """
+        if getattr(self._tx, "conn", None) is not None:
+            yield
+            return
+        with self.pool.connection() as conn:
+            self._tx.conn, self._tx.after_commit = conn, []
+            try:
+                yield
+                conn.commit()
+                callbacks = self._tx.after_commit
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._tx.conn, self._tx.after_commit = None, []
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        if getattr(self._tx, "conn", None) is not None:
+            self._tx.after_commit.append(callback)
+        else:
+            callback()
+
+    # ------------------------- Notifications -------------------------
+    # Messages to other processes using the same database. Only Postgres can
+    # deliver them; elsewhere notify() does nothing and listen() returns False.
+    def notify(self, channel, message):
+        return None
+
+    def listen(self, channel, callback):
+        return False
+
+    # ------------------------- Dialect Helpers -------------------------
+    @abstractmethod
+    def any_of(self, column, values):
+        """SQL and params matching ``column`` against a list of values."""
+
+    @abstractmethod
+    def insert_values(self, cur, query, rows, fetch=False):
+        """Run ``query`` ("... VALUES %s ...") with ``rows`` as multi-row VALUES lists."""
+
+    # ------------------------- Users -------------------------
+    def user_exists(self, username):
+        # True/False, None on error
+        rows = self.prepared("user_exists", (username,), fetch="all")
+        return None if rows is None else bool(rows)
+
+    def find_user(self, username):
+        # USER_FIELDS
+        return self.prepared("user_profile", (username,), fetch="one")
+
+    def user_login(self, username):
+        # (password hash, role, approved)
+        return self.prepared("user_login", (username,), fetch="one")
+
+    def insert_user(self, username, password, name, email, phone, role, approved):
+        # An existing username inserts nothing; returns the row count
+        return self.execute(
+            "INSERT INTO users (username,password,name,email,phone,role,approved) VALUES (%s,%s,%s,%s,%s,%s,%s) "
+            "ON CONFLICT (username) DO NOTHING",
+            (username, password, name, email, phone, role, approved)
+        )
+
+    def set_password(self, username, password, old_password=None):
+        if old_password is None:
+            return self.execute("UPDATE users SET password=%s WHERE username=%s", (password, username))
+        return self.execute("UPDATE users SET password=%s WHERE username=%s AND password=%s",
+                            (password, username, old_password))
+
+    def all_users(self):
+        return self.execute("SELECT " + USER_COLUMNS + " FROM users", fetch="all")
+
+    def list_users(self, columns, approved=None, role=None, prefix=None, after=None, limit=50):
+        where, params = [], []
+        if approved is not None:
+            where.append("approved=%s")
+            params.append(1 if approved else 0)
+        if role:
+            where.append("role=%s")
+            params.append(role)
+        if prefix:
+            where.append("username LIKE %s" + self.like_escape)
+            params.append(like_prefix(prefix))
+        if after is not None:
+            where.append("username" + self.code_point + ">%s")
+            params.append(after)
+        query = "SELECT " + columns + " FROM users"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY username" + self.code_point + " LIMIT %s"
+        return self.execute(query, (*params, limit), fetch="all")
+
+    def approve_users(self, usernames):
+        condition, params = self.any_of("username", usernames)
+        return self.execute("UPDATE users SET approved=1 WHERE " + condition, params)
+
+    def delete_users(self, usernames):
+        condition, params = self.any_of("username", usernames)
+        return self.execute("DELETE FROM users WHERE " + condition, params)
+
+    # ------------------------- Sessions -------------------------
+    def session_token(self, session_id, now):
+        row = self.prepared("session_token", (session_id, now), fetch="one")
+        return row[0] if row else None
+
+    def save_session(self, session_id, token, expires_at):
+        return self.execute(
+            "INSERT INTO sessions (id,token,expires_at) VALUES (%s,%s,%s) "
+            "ON CONFLICT (id) DO UPDATE SET token=excluded.token, expires_at=excluded.expires_at",
+            (session_id, token, expires_at)
+        )
+
+    def delete_session(self, session_id):
+        return self.execute("DELETE FROM sessions WHERE id=%s", (session_id,))
+
+    def purge_sessions(self, now):
+        return self.execute("DELETE FROM sessions WHERE expires_at<=%s", (now,))
+
+    # ------------------------- Recipes -------------------------
+    def write_ingredients(self, cur, recipe_ids, contents):
+        # Replace the ingredient rows of several recipes with one DELETE and one INSERT
+        rows = [row for recipe_id, content in zip(recipe_ids, contents) for row in ingredient_rows(recipe_id, content)]
+        condition, params = self.any_of("recipe_id", list(recipe_ids))
+        cur.execute("DELETE FROM recipe_ingredients WHERE " + condition, params)
+        if rows:
+            self.insert_values(
+                cur, "INSERT INTO recipe_ingredients (recipe_id,position,name,quantity,unit,written_unit) VALUES %s",
+                rows
+            )
+
+    def insert_recipes(self, username, recipes):
+        # recipes: list of (title, content); returns the new ids, None on error
+        def work(cur):
+            rows = self.insert_values(
+                cur, "INSERT INTO recipes (username,title,content) VALUES %s RETURNING id, content",
+                [(username, title, content) for title, content in recipes], fetch=True
+            )
+            self.write_ingredients(cur, *zip(*rows))
+            return [row[0] for row in rows]
+        return self.run(work)
+
+    def import_recipes(self, records, on_conflict="skip"):
+        """Insert ``records`` (dicts with username, title, content) for known
+        users in one statement. Returns ``(written, unknown)``: rows written and
+        records whose user does not exist; None on error."""
+        def work(cur):
+            condition, params = self.any_of("username", list({r["username"] for r in records}))
+            cur.execute("SELECT username FROM users WHERE " + condition, params)
+            known = {row[0] for row in cur.fetchall()}
+            # Later duplicates within a chunk win, matching row-by-row semantics
+            rows = {(r["username"], r["title"]): r.get("content") or "" for r in records if r["username"] in known}
+            unknown = sum(1 for r in records if r["username"] not in known)
+            if not rows:
+                return 0, unknown
+            if on_conflict == "update":
+                conflict = "DO UPDATE SET content = excluded.content"
+            else:
+                conflict = "DO NOTHING"
+            inserted = self.insert_values(
+                cur,
+                "INSERT INTO recipes (username,title,content) VALUES %s "
+                "ON CONFLICT (username, title) " + conflict + " RETURNING id, content",
+                [(u, t, c) for (u, t), c in rows.items()], fetch=True
+            )
+            if inserted:
+                self.write_ingredients(cur, *zip(*inserted))
+            return len(inserted), unknown
+        return self.run(work)
+
+    @abstractmethod
+    def export_recipes(self, username=None, chunk_size=BULK_PAGE_SIZE):
+        """Yield lists of (username, title, content) rows in id order."""
+
+    def recipes(self, username):
+        return self.prepared("recipes", (username,), fetch="all")
+
+    def recipe_page(self, username, after_title, limit):
+        # Keyset pagination on the (username, title) index
+        if after_title is None:
+            return self.prepared("recipe_page", (username, limit), fetch="all")
+        return self.prepared("recipe_page_after", (username, after_title, limit), fetch="all")
+
+    def recipe(self, username, recipe_id):
+        return self.prepared("recipe", (recipe_id, username), fetch="one")
+
+    def recipe_rendered(self, username, recipe_id):
+        # (id, title, content, rendered_html, rendered_hash)
+        return self.prepared("recipe_rendered", (recipe_id, username), fetch="one")
+
+    def save_rendered(self, recipe_id, content_hash, html):
+        # A copy rendered from since-changed content is harmless: readers
+        # compare rendered_hash with the hash of the content they got
+        return self.execute(
+            "UPDATE recipes SET rendered_html=%s, rendered_hash=%s "
+            "WHERE id=%s AND (rendered_hash IS NULL OR rendered_hash<>%s)",
+            (html, content_hash, recipe_id, content_hash))
+
+    @abstractmethod
+    def search_recipes(self, username, query, offset, limit):
+        """Ranked matches as SEARCH_FIELDS rows."""
+
+    def delete_recipes(self, username, recipe_ids):
+        condition, params = self.any_of("id", recipe_ids)
+        return self.execute("DELETE FROM recipes WHERE username=%s AND " + condition, (username, *params))
+
+    def update_recipe(self, username, recipe_id, title, content):
+        def work(cur):
+            cur.execute("UPDATE recipes SET title=%s, content=%s, rendered_html=NULL, rendered_hash=NULL "
+                        "WHERE id=%s AND username=%s",
+                        (title, content, recipe_id, username))
+            if not cur.rowcount: return False
+            self.write_ingredients(cur, [recipe_id], [content])
+            return True
+        return self.run(work)
+
+    # ------------------------- Ingredients -------------------------
+    def ingredients(self, username, recipe_id, factor=1.0):
+        # Quantities are multiplied in SQL; rows are INGREDIENT_FIELDS
+        return self.prepared("ingredients", (factor, recipe_id, username), fetch="all")
+
+    @abstractmethod
+    def shopping_list(self, username, recipe_factors):
+        """(name, total, base unit) rows summed over recipe id -> factor."""
+
+    def recipes_with_ingredient(self, username, prefix):
+        # RECIPE_SUMMARY_FIELDS
+        return self.execute("""
+            SELECT r.id, r.title FROM recipes r
+            WHERE r.username=%s AND EXISTS (
+                SELECT 1 FROM recipe_ingredients i
+                WHERE i.recipe_id = r.id AND lower(i.name) LIKE %s""" + self.like_escape + """
+            )
+            ORDER BY r.title
+        """, (username, like_prefix(prefix)), fetch="all")
+
+    def backfill_ingredients(self, batch_size=500):
+        # One-off: parse recipes saved before recipe_ingredients existed.
+        # Each batch commits on its own, so a rerun picks up where a failed
+        # one stopped.
+        def work(cur, after_id):
+            cur.execute("""
+                SELECT id, content FROM recipes r
+                WHERE id > %s AND NOT EXISTS (SELECT 1 FROM recipe_ingredients i WHERE i.recipe_id = r.id)
+                ORDER BY id LIMIT %s
+            """, (after_id, batch_size))
+            rows = cur.fetchall()
+            if rows:
+                self.write_ingredients(cur, *zip(*rows))
+            return rows
+        done, after_id = 0, 0
+        while True:
+            rows = self.run(lambda cur: work(cur, after_id))
+            if rows is None:
+                raise RuntimeError(f"ingredient backfill failed after {done} recipes")
+            if not rows:
+                self.needs_backfill = False
+                return done
+            done += len(rows)
+            after_id = rows[-1][0]
+
+
+# ------------------------- Postgres -------------------------
+class PostgresStorage(Storage):
+    dialect = "postgres"
+    # Byte order of UTF-8, i.e. code point order; indexed by migration 8
+    code_point = ' COLLATE "C"'
+
+    def __init__(self, dsn, connect_timeout=10, prepare=DB_PREPARED_STATEMENTS, **pool_settings):
+        # TLS by default; an sslmode in the DSN or PGSSLMODE wins (keywords
+        # passed to connect() would override both)
+        ssl = {}
+        if "sslmode" not in psycopg2.extensions.parse_dsn(dsn) and not os.getenv("PGSSLMODE"):
+            ssl["sslmode"] = "require"
+        def connect():
+            return psycopg2.connect(dsn, connect_timeout=connect_timeout, **ssl,
+                                    connection_factory=PreparingConnection, cursor_factory=InstrumentedCursor)
+        self._connect = connect
+        self.prepare = prepare
+        self._stopped = threading.Event()
+        super().__init__(ConnectionPool(connect, **pool_settings))
+
+    def close(self):
+        self._stopped.set()
+        super().close()
+
+    def is_disconnect(self, error):
+        return is_disconnect(error)
+
+    def prepared(self, name, params=(), fetch=None):
+        """Run a STATEMENTS entry with PREPARE once per connection, then EXECUTE.
+
+        The server skips parsing and, once it settles on a generic plan,
+        planning. Placeholder types are inferred from the statement.
+        """
+        if not self.prepare:
+            return super().prepared(name, params, fetch)
+        def work(cur):
+            prepared = cur.connection.prepared
+            try:
+                if name not in prepared:
+                    cur.execute("PREPARE " + name + " AS " + numbered_query(self.statement(name)))
+                    prepared.add(name)
+                cur.execute("EXECUTE " + name + " (" + ",".join(["%s"] * len(params)) + ")", params)
+            except psycopg2.Error as e:
+                if e.pgcode == "26000":
+                    # Deallocated behind our back (e.g. DISCARD ALL): prepare again next time
+                    prepared.discard(name)
+                raise
+            return fetch_result(cur, fetch)
+        return self.run(work)
+
+    def notify(self, channel, message):
+        # Delivered to listeners when the statement commits
+        return self.execute("SELECT pg_notify(%s, %s)", (channel, message), fetch="one")
+
+    def listen(self, channel, callback):
+        """Call ``callback(payload)`` for each NOTIFY on ``channel`` until close().
+
+        Listens on its own connection, outside the pool, from a daemon thread.
+        Messages sent while it reconnects are lost.
+        """
+        threading.Thread(target=self._listen, args=(channel, callback),
+                         name="listen-" + channel, daemon=True).start()
+        return True
+
+    def _listen(self, channel, callback):
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute('LISTEN "' + channel + '"')
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], LISTEN_POLL_INTERVAL) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        try:
+                            callback(notification.payload)
+                        except Exception as e:
+                            print("Notification handler failed:", e)
+            except Exception as e:
+                if not self._stopped.is_set():
+                    print("Notification listener failed, reconnecting:", e)
+                    self._stopped.wait(LISTEN_RETRY_DELAY)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def any_of(self, column, values):
+        # One statement shape regardless of how many values
+        return column + " = ANY(%s)", (list(values),)
+
+    def insert_values(self, cur, query, rows, fetch=False):
+        return psycopg2.extras.execute_values(cur, query, rows, page_size=BULK_PAGE_SIZE, fetch=fetch)
+
+    def export_recipes(self, username=None, chunk_size=BULK_PAGE_SIZE):
+        # Server-side cursor so memory stays flat regardless of table size
+        query = "SELECT username, title, content FROM recipes"
+        params = ()
+        if username:
+            query += " WHERE username=%s"
+            params = (username,)
+        query += " ORDER BY id"
+        with self.pool.connection() as conn:
+            with conn.cursor(name="recipe_export") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            conn.rollback()
+
+    def search_recipes(self, username, query, offset, limit):
+        # Ranked full-text search on the GIN-indexed search column; snippets are
+        # only built for the rows on the requested page
+        return self.execute("""
+            SELECT id, title, rank,
+                   ts_headline('english', content, q, 'MaxFragments=2, MaxWords=20, MinWords=5, StartSel=**, StopSel=**')
+            FROM (
+                SELECT id, title, content, q, ts_rank(search, q) AS rank
+                FROM recipes, websearch_to_tsquery('english', %s) AS q
+                WHERE username=%s AND search @@ q
+                ORDER BY rank DESC, id
+                LIMIT %s OFFSET %s
+            ) hits
+            ORDER BY rank DESC, id
+        """, (query, username, limit, offset), fetch="all")
+
+    def shopping_list(self, username, recipe_factors):
+        ids, factors = zip(*recipe_factors.items())
+        return self.execute("""
+            SELECT min(i.name), sum(i.quantity * f.factor), i.unit
+            FROM unnest(%s::int[], %s::float8[]) AS f(recipe_id, factor)
+            JOIN recipes r ON r.id = f.recipe_id AND r.username=%s
+            JOIN recipe_ingredients i ON i.recipe_id = r.id
+            GROUP BY lower(i.name), i.unit
+            ORDER BY lower(i.name), i.unit
+        """, (list(ids), list(factors), username), fetch="all")
+
+
+# ------------------------- SQLite -------------------------
+# Search terms become quoted FTS5 strings so user input cannot inject query
+# syntax; a leading "-" excludes a term, "quoted phrases" match in order.
+_SEARCH_TERM = re.compile(r'(-?)(?:"([^"]*)"|(\S+))')
+
+
+def fts_query(text):
+    include, exclude = [], []
+    for negate, phrase, word in _SEARCH_TERM.findall(text):
+        term = (phrase or word).strip()
+        if term:
+            (exclude if negate else include).append('"' + term.replace('"', '""') + '"')
+    if not include:
+        return None
+    return " ".join(include) + "".join(" NOT " + term for term in exclude)
+
+
+class SqliteStorage(Storage):
+    """Embedded database in one file, for single-user installs and tests.
+
+    WAL mode lets readers run alongside the single writer; each pooled
+    connection gets the same pragmas.
+    """
+
+    dialect = "sqlite"
+    like_escape = " ESCAPE '\\'"
+
+    def __init__(self, path, connect_timeout=10, **pool_settings):
+        if sqlite3.sqlite_version_info < (3, 35, 0):
+            raise RuntimeError("SQLite 3.35 or newer is required, found " + sqlite3.sqlite_version)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        super().__init__(ConnectionPool(self._connect, **pool_settings))
+
+    def _connect(self):
+        # Connections move between pool threads but are used by one at a time
+        # sqlite3 keeps each statement compiled per connection, so the hot
+        # statements are prepared once without PREPARE
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints instead of every commit; WAL keeps the file consistent
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # Match Postgres: LIKE is case-sensitive and prefix patterns can use indexes
+        conn.execute("PRAGMA case_sensitive_like=ON")
+        return SqliteConnection(conn)
+
+    def is_disconnect(self, error):
+        # The file cannot go away, but a connection closed under the pool can
+        return isinstance(error, sqlite3.ProgrammingError) and "closed database" in str(error)
+
+    def close(self):
+        # Fold the WAL back into the main file so it is not left behind
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("PRAGMA optimize")
+                    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            print("SQLite checkpoint failed:", e)
+        super().close()
+
+    def any_of(self, column, values):
+        values = list(values)
+        return column + " IN (" + ",".join(["%s"] * len(values)) + ")", values
+
+    def insert_values(self, cur, query, rows, fetch=False):
+        # SQLite caps bound variables per statement (32766)
+        page_size = max(1, min(BULK_PAGE_SIZE, 32766 // len(rows[0])))
+        placeholder = "(" + ",".join(["%s"] * len(rows[0])) + ")"
+        result = []
+        for start in range(0, len(rows), page_size):
+            page = rows[start:start + page_size]
+            cur.execute(query.replace("VALUES %s", "VALUES " + ",".join([placeholder] * len(page)), 1),
+                        [value for row in page for value in row])
+            if fetch:
+                result.extend(cur.fetchall())
+        return result if fetch else None
+
+    def export_recipes(self, username=None, chunk_size=BULK_PAGE_SIZE):
+        # SQLite steps through the result lazily; fetchmany keeps memory flat
+        query = "SELECT username, title, content FROM recipes"
+        params = ()
+        if username:
+            query += " WHERE username=%s"
+            params = (username,)
+        query += " ORDER BY id"
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    def search_recipes(self, username, query, offset, limit):
+        # bm25 is lower-is-better; titles weigh ten times the body like the
+        # A/B weights on Postgres
+        match = fts_query(query)
+        if match is None:
+            return []
+        return self.execute("""
+            SELECT r.id, r.title, -bm25(recipes_fts, 10.0, 1.0) AS rank,
+                   snippet(recipes_fts, 1, '**', '**', '...', 20)
+            FROM recipes_fts JOIN recipes r ON r.id = recipes_fts.rowid
+            WHERE recipes_fts MATCH %s AND r.username=%s
+            ORDER BY rank DESC, r.id
+            LIMIT %s OFFSET %s
+        """, (match, username, limit, offset), fetch="all")
+
+    def shopping_list(self, username, recipe_factors):
+        # The id/factor pairs travel as one JSON array so the statement shape is fixed
+        pairs = json.dumps([[int(recipe_id), float(factor)] for recipe_id, factor in recipe_factors.items()])
+        return self.execute("""
+            SELECT min(i.name), sum(i.quantity * f.factor), i.unit
+            FROM (SELECT json_extract(value, '$[0]') AS recipe_id, json_extract(value, '$[1]') AS factor
+                  FROM json_each(%s)) f
+            JOIN recipes r ON r.id = f.recipe_id AND r.username=%s
+            JOIN recipe_ingredients i ON i.recipe_id = r.id
+            GROUP BY lower(i.name), i.unit
+            ORDER BY lower(i.name), i.unit
+        """, (pairs, username), fetch="all")
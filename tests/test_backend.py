@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+import backend
+import hashing
+from storage import SqliteStorage
+
+
+@pytest.fixture
+def app_backend(tmp_path, monkeypatch):
+    # The backend on a fresh SQLite file, as after startup
+    monkeypatch.setattr(backend, "DATABASE_URL", "sqlite:///" + str(tmp_path / "app.db"))
+    monkeypatch.setattr(hashing, "BCRYPT_ROUNDS", 4)
+    for cache in (backend.user_cache, backend.user_list_cache, backend.render_cache):
+        cache.clear()
+    assert backend.init() is True
+    # A new database starts an (empty) ingredient backfill
+    backend._backfill_thread.join(5)
+    backend.store.insert_user("alice", "hash", "Alice", "alice@example.com", "1", "user", 1)
+    yield backend
+    backend.close()
+
+
+# ------------------------- Ingredients -------------------------
+def test_scale_recipe(app_backend):
+    backend.add_recipe("alice", "Bread", "## Ingredients\n- Flour 0.5 kg\n- Water 300 ml\n## Steps\nBake 40")
+    [bread] = backend.get_recipe_page("alice")["recipes"]
+    assert backend.scale_recipe("alice", bread["id"], 2) == "Flour 1.00 kg\nWater 600.00 ml"
+    assert backend.scale_recipe("alice", bread["id"], 3, normalize=True) == "Flour 1.50 kg\nWater 900.00 ml"
+    # Other users' recipes have no ingredients to them
+    assert backend.scale_recipe("bob", bread["id"], 2) == ""
+
+
+def test_free_text_steps_are_not_ingredients(app_backend):
+    backend.add_recipe("alice", "Cake", "Preheat oven to 180 C\n- Flour 200 g\nMix and bake for 30 minutes")
+    [cake] = backend.get_recipe_page("alice")["recipes"]
+    assert backend.get_ingredients("alice", cake["id"]) == [
+        {"name": "Flour", "quantity": 200.0, "unit": "g", "written_unit": "g"}]
+    assert backend.find_recipes_by_ingredient("alice", "preheat") == []
+    assert backend.find_recipes_by_ingredient("alice", "mix") == []
+
+
+def test_shopping_list_and_ingredient_lookup(app_backend):
+    backend.add_recipes("alice", [
+        ("Bread", "- Flour 500 g\n- Water 300 ml"),
+        ("Pancakes", "## Ingredients\n- flour 600 g\n- Eggs 2"),
+    ])
+    ids = {r["title"]: r["id"] for r in backend.get_recipe_page("alice")["recipes"]}
+    assert backend.shopping_list("alice", {ids["Bread"]: 1, ids["Pancakes"]: 2}) == [
+        "Eggs 4.00", "Flour 1.70 kg", "Water 300.00 ml"]
+    assert backend.shopping_list("alice", {}) == []
+    assert backend.find_recipes_by_ingredient("alice", " Flo ") == [
+        {"id": ids["Bread"], "title": "Bread"}, {"id": ids["Pancakes"], "title": "Pancakes"}]
+    assert backend.find_recipes_by_ingredient("alice", "egg") == [{"id": ids["Pancakes"], "title": "Pancakes"}]
+    assert backend.find_recipes_by_ingredient("alice", " ") == []
+
+
+# ------------------------- Startup -------------------------
+def test_init_is_idempotent_and_records_phases(app_backend):
+    assert backend.is_ready()
+    store = backend.store
+    assert backend.init() is True
+    assert backend.store is store
+    assert backend.startup["ready"] is True
+    assert set(backend.startup["phases"]) == {"connect", "schema", "superuser"}
+    assert backend.startup["schema_version"] == backend.store.migrate()
+    assert backend.check_health() is True
+
+
+def test_failed_init_phase_resets_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "DATABASE_URL", "sqlite:///" + str(tmp_path / "app.db"))
+    def fail():
+        raise RuntimeError("superuser setup failed")
+    monkeypatch.setattr(backend, "create_superuser", fail)
+    assert backend.init() is False
+    # A store published before the failing phase is withdrawn and closed
+    assert backend.store is None and not backend.is_ready()
+    assert backend.startup["ready"] is False
+    assert backend.startup["error"] == "superuser setup failed"
+    assert backend.check_health() is False
+
+    # The next call starts over and succeeds
+    monkeypatch.undo()
+    monkeypatch.setattr(backend, "DATABASE_URL", "sqlite:///" + str(tmp_path / "app.db"))
+    monkeypatch.setattr(hashing, "BCRYPT_ROUNDS", 4)
+    assert backend.init() is True
+    assert backend.startup["error"] is None
+    assert backend.get_user("admin")["role"] == "superuser"
+    backend.close()
+
+
+def test_ingredient_backfill_runs_after_readiness(tmp_path, monkeypatch):
+    # The original app's database: migrating adds recipe_ingredients empty
+    path = tmp_path / "app.db"
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "app.db"), path)
+    legacy = sqlite3.connect(path)
+    legacy.execute("INSERT INTO recipes (username, title, content) VALUES ('admin', 'Bread', '- Flour 500 g')")
+    legacy.commit()
+    legacy.close()
+    monkeypatch.setattr(backend, "DATABASE_URL", "sqlite:///" + str(path))
+    monkeypatch.setattr(hashing, "BCRYPT_ROUNDS", 4)
+    parsing = threading.Event()
+    def slow_backfill(self, batch_size=500):
+        # Readiness does not wait for the backfill
+        assert backend.is_ready() and backend.startup["ready"]
+        parsing.set()
+        return original(self, batch_size)
+    original = SqliteStorage.backfill_ingredients
+    monkeypatch.setattr(SqliteStorage, "backfill_ingredients", slow_backfill)
+    try:
+        assert backend.init() is True
+        backend._backfill_thread.join(5)
+        assert parsing.is_set()
+        assert backend.startup["backfill"] == "done"
+        [bread] = backend.get_recipe_page("admin")["recipes"]
+        assert backend.get_ingredients("admin", bread["id"])[0]["name"] == "Flour"
+    finally:
+        backend.close()
+
+
+def test_failed_background_backfill_is_reported(app_backend, monkeypatch, capsys):
+    monkeypatch.setattr(backend.store, "run", lambda work: None)
+    backend._backfill_in_background()
+    assert backend.startup["backfill"] == "failed"
+    assert "run 'python bulk.py backfill'" in capsys.readouterr().out
+    with pytest.raises(RuntimeError):
+        backend.backfill_ingredients()
+
+
+# ------------------------- Scaling API -------------------------
+@pytest.fixture
+def scale_caches():
+    backend.scale_cache.clear()
+    backend.parse_cache.clear()
+    yield backend.scale_cache
+
+
+def test_scale_batch_results_in_job_order(scale_caches):
+    results = backend.scale_batch([
+        {"ingredients": "Flour 500 g\nsome salt\nEggs 2", "base": 4, "target": 10},
+        {"ingredients": "Flour 500 g", "base": 1, "target": 3, "normalize": True},
+        "not a job",
+    ])
+    assert results[0] == {
+        "factor": 2.5,
+        "ingredients": [{"name": "Flour", "quantity": 1250.0, "unit": "g"}, {"name": "Eggs", "quantity": 5.0, "unit": ""}],
+        "text": "Flour 1250.00 g\nEggs 5.00",
+        "errors": [{"line": 2, "text": "some salt"}],
+    }
+    assert results[1]["text"] == "Flour 1.50 kg"
+    assert results[2] == {"error": "job must be an object"}
+
+
+@pytest.mark.parametrize("job, error", [
+    ({"ingredients": 5, "base": 1, "target": 2}, "ingredients must be a string"),
+    ({"ingredients": "Eggs 2", "base": "x", "target": 2}, "base and target must be numbers"),
+    ({"ingredients": "Eggs 2", "target": 2}, "base and target must be numbers"),
+    ({"ingredients": "Eggs 2", "base": 1, "target": 10 ** 400}, "base and target must be numbers"),
+    ({"ingredients": "Eggs 2", "base": 0, "target": 2}, "base must be positive and target zero or more"),
+    ({"ingredients": "Eggs 2", "base": 1, "target": float("nan")}, "base must be positive and target zero or more"),
+    ({"ingredients": "Eggs 2", "base": 1e-308, "target": 1e308}, "target / base is too large"),
+])
+def test_scale_batch_rejects_invalid_jobs(scale_caches, job, error):
+    assert backend.scale_batch([job]) == [{"error": error}]
+
+
+def test_scale_batch_caps_ingredient_text(scale_caches, monkeypatch):
+    monkeypatch.setattr(backend, "SCALE_MAX_TEXT", 20)
+    ok, too_long = backend.scale_batch([
+        {"ingredients": "Flour 500 g", "base": 1, "target": 2},
+        {"ingredients": "Flour 500 g\n" * 2, "base": 1, "target": 2},
+    ])
+    assert ok["text"] == "Flour 1000.00 g"
+    assert too_long == {"error": "ingredients must be at most 20 characters"}
+
+
+def test_scale_batch_reports_overflow_per_job(scale_caches):
+    results = backend.scale_batch([
+        {"ingredients": "Flour 1e308 g", "base": 1, "target": 10},
+        {"ingredients": "Flour 1e400 g\nEggs 2", "base": 1, "target": 2},
+        {"ingredients": "Eggs 2", "base": 1, "target": 2},
+    ])
+    assert results[0] == {"error": "scaled quantities are too large"}
+    # A quantity that is not a finite number makes its line unparsable
+    assert results[1]["text"] == "Eggs 4.00"
+    assert results[1]["errors"] == [{"line": 1, "text": "Flour 1e400 g"}]
+    assert results[2]["text"] == "Eggs 4.00"
+    # Every result, cached ones included, can be sent as strict JSON
+    json.dumps(results, allow_nan=False)
+    json.dumps(backend.scale_batch([{"ingredients": "Flour 1e308 g", "base": 1, "target": 10}]), allow_nan=False)
+
+
+def test_scale_batch_serves_repeats_from_the_cache(scale_caches):
+    job = {"ingredients": "Flour 500 g\nEggs 2", "base": 2, "target": 4}
+    # Whitespace differences normalize to the same key
+    same = {"ingredients": "  Flour   500 g\nEggs 2\n\n", "base": 1, "target": 2}
+    first = backend.scale_batch([job, same])
+    assert first[0] is first[1]
+    assert backend.scale_cache.stats()["size"] == 1
+    hits = backend.scale_cache.stats()["hits"]
+    assert backend.scale_batch([job]) == [first[0]]
+    assert backend.scale_cache.stats()["hits"] == hits + 1
+    # Another factor reuses the parsed text
+    assert backend.scale_batch([dict(job, target=6)])[0]["text"] == "Flour 1500.00 g\nEggs 6.00"
+    assert backend.parse_cache.stats()["size"] == 1
+
+
+def test_scale_key_normalizes_text():
+    key, error = backend._scale_key({"ingredients": " Flour  1 g \n", "base": "2", "target": 3, "normalize": 1})
+    assert (key, error) == (("Flour 1 g", 1.5, True), None)
@@ -0,0 +1,101 @@
+import io
+import json
+
+import pytest
+
+import backend
+import bulk
+import migrations
+from storage import SqliteStorage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SqliteStorage(str(tmp_path / "bulk.db"), minconn=1, maxconn=2)
+    assert store.migrate() == migrations.latest_version("sqlite")
+    store.insert_user("alice", "hash", "Alice", "a@example.com", "1", "user", 1)
+    monkeypatch.setattr(backend, "store", store)
+    yield store
+    store.close()
+
+
+def jsonl(*records):
+    return io.StringIO("".join((r if isinstance(r, str) else json.dumps(r)) + "\n" for r in records))
+
+
+def counts(stats):
+    return {key: stats[key] for key in ("read", "written", "skipped", "rejected")}
+
+
+def test_import_counts_written_skipped_and_rejected(store):
+    store.insert_recipes("alice", [("Existing", "old")])
+    stats = bulk.import_recipes(jsonl(
+        {"username": "alice", "title": "New", "content": "- Flour 1 g"},
+        {"username": "alice", "title": "Existing", "content": "new"},
+        # Unknown users are rejected, not skipped
+        {"username": "ghost", "title": "Lost", "content": ""},
+        {"username": "alice", "title": "", "content": "untitled"},
+    ))
+    assert counts(stats) == {"read": 4, "written": 1, "skipped": 1, "rejected": 2}
+    assert [row[2:] for row in store.recipes("alice")] == [("Existing", "old"), ("New", "- Flour 1 g")]
+
+
+def test_malformed_records_are_rejected_without_aborting(store):
+    stats = bulk.import_recipes(jsonl(
+        {"username": "alice", "title": "First", "content": ""},
+        '{"username": "alice", "title": "Broken"',
+        '["alice", "List", ""]',
+        "42",
+        {"username": ["alice"], "title": "Odd user", "content": ""},
+        {"username": "alice", "title": "Odd content", "content": {"text": "x"}},
+        {"username": "alice", "title": "Last"},
+    ), chunk_size=2)
+    assert counts(stats) == {"read": 7, "written": 2, "skipped": 0, "rejected": 5}
+    assert sorted(row[2] for row in store.recipes("alice")) == ["First", "Last"]
+
+
+def test_storage_failure_stops_the_import(store, monkeypatch, tmp_path, capsys):
+    original = store.import_recipes
+    chunks = []
+    def fail_second_chunk(records, on_conflict):
+        chunks.append(records)
+        return None if len(chunks) == 2 else original(records, on_conflict)
+    monkeypatch.setattr(store, "import_recipes", fail_second_chunk)
+    records = [{"username": "alice", "title": f"Recipe {i}", "content": ""} for i in range(5)]
+    # Database errors are not counted as rejected input
+    with pytest.raises(bulk.ImportFailed) as failed:
+        bulk.import_recipes(jsonl(*records), chunk_size=2)
+    assert failed.value.offset == 2
+    assert counts(failed.value.stats) == {"read": 2, "written": 2, "skipped": 0, "rejected": 0}
+    assert [row[2] for row in store.recipes("alice")] == ["Recipe 0", "Recipe 1"]
+
+    # The command line exits non-zero, naming where it stopped
+    path = tmp_path / "recipes.jsonl"
+    path.write_text(jsonl(*records).getvalue())
+    chunks.clear()
+    monkeypatch.setattr(backend, "init", lambda: True)
+    with pytest.raises(SystemExit) as exit_info:
+        bulk.main(["import", str(path), "--chunk-size", "2"])
+    assert exit_info.value.code == "import stopped: database error storing the records from #3 on"
+    assert "2 read, 0 written, 2 skipped, 0 rejected" in capsys.readouterr().err
+
+
+def test_csv_round_trip(store):
+    data = io.StringIO("username,title,content\nalice,Bread,\"- Flour 500 g\nBake it\"\nghost,Lost,\n")
+    stats = bulk.import_recipes(data, fmt="csv")
+    assert counts(stats) == {"read": 2, "written": 1, "skipped": 0, "rejected": 1}
+    out = io.StringIO()
+    assert bulk.export_recipes(out, fmt="csv")["written"] == 1
+    assert out.getvalue().splitlines() == ["username,title,content", 'alice,Bread,"- Flour 500 g', 'Bake it"']
+
+
+def test_jsonl_export_reads_back(store):
+    store.insert_recipes("alice", [("A", "one"), ("B", "two")])
+    out = io.StringIO()
+    stats = bulk.export_recipes(out, chunk_size=1)
+    assert (stats["read"], stats["written"]) == (2, 2)
+    out.seek(0)
+    assert list(bulk.read_records(out, "jsonl")) == [
+        {"username": "alice", "title": "A", "content": "one"},
+        {"username": "alice", "title": "B", "content": "two"},
+    ]
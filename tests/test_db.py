@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from db import ConnectionPool, PoolTimeout, SqliteConnection, numbered_query, sqlite_query
+
+
+def connect():
+    return SqliteConnection(sqlite3.connect(":memory:", check_same_thread=False))
+
+
+# ------------------------- Placeholders -------------------------
+def test_placeholders():
+    assert sqlite_query("SELECT %s, '100%%' WHERE a=%s") == "SELECT ?, '100%' WHERE a=?"
+    assert numbered_query("SELECT %s, '100%%' WHERE a=%s") == "SELECT $1, '100%' WHERE a=$2"
+
+
+# ------------------------- Connection Pool -------------------------
+def test_pool_reuses_connections():
+    pool = ConnectionPool(connect, minconn=1, maxconn=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["in_use"], stats["checkouts"]) == (1, 1, 0, 2)
+    pool.closeall()
+
+
+def test_pool_times_out_when_exhausted():
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, timeout=0.05)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+    pool.putconn(conn)
+    # The returned connection is handed to the next caller
+    assert pool.getconn() is conn
+    pool.closeall()
+
+
+def test_pool_wakes_waiting_threads():
+    pool = ConnectionPool(connect, minconn=1, maxconn=1, timeout=5)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert pool.stats()["waits"] == 1
+    pool.closeall()
+
+
+def test_pool_replaces_broken_connections():
+    pool = ConnectionPool(connect, minconn=1, maxconn=1, healthcheck_interval=0)
+    with pool.connection() as conn:
+        pass
+    conn._conn.close()  # dropped behind the pool's back, still marked open
+    with pool.connection() as fresh:
+        assert fresh is not conn
+        with fresh.cursor() as cur:
+            assert cur.execute("SELECT 1").fetchone() == (1,)
+    assert pool.stats()["reconnects"] == 1
+    pool.closeall()
+
+
+def test_pool_discards_idle_connections_checked_in_before_a_failure():
+    pool = ConnectionPool(connect, minconn=3, maxconn=3)
+    in_use = pool.getconn()
+    failed_at = time.monotonic()
+    pool.putconn(in_use)
+    assert pool.discard_idle(failed_at) == 2
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["reconnects"]) == (1, 1, 2)
+    # Connections returned after the failure are kept
+    assert pool.getconn() is in_use
+    pool.closeall()
+
+
+def test_pool_discards_closed_connections_and_failed_connects():
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 2:
+            raise sqlite3.OperationalError("unreachable")
+        return connect()
+    pool = ConnectionPool(flaky, minconn=0, maxconn=1)
+    with pool.connection() as conn:
+        conn.close()
+    assert pool.stats()["size"] == 0
+    with pytest.raises(sqlite3.OperationalError):
+        pool.getconn()
+    # The failed connect released its slot
+    assert pool.stats()["size"] == 0
+    with pool.connection():
+        assert pool.stats()["in_use"] == 1
+    pool.closeall()
+
+
+def test_closed_pool_rejects_checkouts():
+    pool = ConnectionPool(connect, minconn=1, maxconn=1)
+    pool.closeall()
+    assert pool.stats()["size"] == 0
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+
+def test_pool_rejects_invalid_sizes():
+    with pytest.raises(ValueError):
+        ConnectionPool(connect, minconn=2, maxconn=1)
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+
+import async_backend
+import hashing
+
+
+@pytest.fixture(scope="module", autouse=True)
+def workers():
+    yield
+    hashing.shutdown()
+
+
+def test_hash_and_check():
+    hashed = hashing.hash_password("secret", rounds=4)
+    assert hashing.hash_rounds(hashed) == 4
+    assert hashing.check_password("secret", hashed) is True
+    assert hashing.check_password("wrong", hashed) is False
+    assert hashing.needs_rehash(hashed) == (hashing.BCRYPT_ROUNDS > 4)
+    assert hashing.hash_rounds("not a hash") == 0
+
+
+def test_hashing_rejects_callers_beyond_the_pending_limit(monkeypatch):
+    monkeypatch.setattr(hashing, "_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(hashing, "HASH_QUEUE_TIMEOUT", 0.01)
+    assert hashing._slots.acquire()
+    with pytest.raises(hashing.HashingBusy):
+        hashing.hash_password("secret", rounds=4)
+    hashing._slots.release()
+
+
+def test_async_auth_calls_are_admitted_before_queueing(monkeypatch):
+    # Callers beyond the slot count fail fast instead of waiting in the
+    # executor's queue, where the hashing timeout would never apply
+    monkeypatch.setattr(hashing, "HASH_QUEUE_TIMEOUT", 0.05)
+    release = threading.Event()
+    def slow_login(username):
+        release.wait(5)
+        return username
+
+    async def scenario():
+        monkeypatch.setattr(async_backend, "auth_slots", asyncio.Semaphore(2))
+        login = async_backend._wrap_auth(slow_login)
+        calls = [asyncio.ensure_future(login(f"user{i}")) for i in range(5)]
+        await asyncio.sleep(0.2)
+        release.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert sorted(r for r in results if isinstance(r, str)) == ["user0", "user1"]
+    assert sum(isinstance(r, hashing.HashingBusy) for r in results) == 3
@@ -0,0 +1,66 @@
+import backend
+import metrics
+from cache import TTLCache
+
+
+def test_normalize_sql_collapses_literals_and_lists():
+    assert metrics.normalize_sql("SELECT * FROM users WHERE username='bob' AND approved=1") == \
+        "SELECT * FROM users WHERE username=? AND approved=?"
+    assert metrics.normalize_sql("INSERT INTO t (a,b) VALUES (%s,%s),(%s,%s)") == "INSERT INTO t (a,b) VALUES (...)"
+    assert metrics.normalize_sql("DELETE FROM t WHERE id IN (%s, %s, %s)") == "DELETE FROM t WHERE id IN (...)"
+    assert metrics.normalize_sql("SELECT  1\n  FROM   t") == "SELECT ? FROM t"
+
+
+def test_long_statements_are_normalized_without_caching():
+    # execute_values inlines row data: bulk INSERTs are large and never repeat
+    long_insert = "INSERT INTO t (a) VALUES " + ",".join(f"('{i}')" for i in range(2000))
+    assert len(long_insert) >= metrics.NORMALIZE_CACHE_MAX_LEN
+    before = metrics._normalize_cached.cache_info().currsize
+    assert metrics.normalize_sql(long_insert) == "INSERT INTO t (a) VALUES (...)"
+    assert metrics._normalize_cached.cache_info().currsize == before
+    metrics.normalize_sql("SELECT 1 FROM cached_statement_test")
+    assert metrics._normalize_cached.cache_info().currsize == before + 1
+
+
+def test_counters_and_histograms_render():
+    counter = metrics.Counter("things_total", "Things.", "kind")
+    counter.inc('a"b')
+    counter.inc('a"b', 2)
+    assert counter.render() == ["# HELP things_total Things.", "# TYPE things_total counter",
+                                'things_total{kind="a\\"b"} 3']
+    histogram = metrics.Histogram("wait_seconds", "Waits.", "op", buckets=(0.1, 1.0))
+    histogram.observe("x", 0.05)
+    histogram.observe("x", 5.0)
+    assert histogram.render()[2:] == [
+        'wait_seconds_bucket{op="x",le="0.1"} 1',
+        'wait_seconds_bucket{op="x",le="1.0"} 1',
+        'wait_seconds_bucket{op="x",le="+Inf"} 2',
+        'wait_seconds_sum{op="x"} 5.05',
+        'wait_seconds_count{op="x"} 2',
+    ]
+
+
+def test_cache_counters_are_exported_as_counters(monkeypatch):
+    cache = TTLCache(maxsize=1)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.set("b", 2)
+    monkeypatch.setattr(metrics, "sources", [lambda: metrics.cache_samples("demo_cache", cache.stats())])
+    text = metrics.render()
+    assert "# HELP demo_cache_size Entries in the cache.\n# TYPE demo_cache_size gauge\ndemo_cache_size 1\n" in text
+    assert "# TYPE demo_cache_hits_total counter\ndemo_cache_hits_total 1\n" in text
+    assert "# TYPE demo_cache_evictions_total counter\ndemo_cache_evictions_total 1\n" in text
+
+
+def test_backend_pool_and_cache_metrics_types():
+    types = {}
+    for source in (backend._pool_metrics, backend._cache_metrics, backend._render_metrics, backend._scale_metrics):
+        for name, kind, help_text, value in source():
+            assert help_text
+            types[name] = kind
+    for name in ("db_pool_checkouts_total", "db_pool_checkout_wait_seconds_total", "db_pool_timeouts_total",
+                 "db_pool_reconnects_total", "user_cache_users_hits_total", "recipe_html_cache_misses_total",
+                 "scale_result_cache_evictions_total"):
+        assert types[name] == "counter"
+    assert all(kind == "counter" for name, kind in types.items() if name.endswith("_total"))
+    assert all(kind == "gauge" for name, kind in types.items() if not name.endswith("_total"))
@@ -0,0 +1,104 @@
+import pytest
+
+import scaling
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2", 2.0),
+    ("1.5", 1.5),
+    ("1/2", 0.5),
+    ("½", 0.5),
+    ("abc", None),
+    ("1/0", None),
+    # Only finite numbers are quantities
+    ("1e400", None),
+    ("inf", None),
+    ("nan", None),
+])
+def test_parse_quantity(text, expected):
+    assert scaling.parse_quantity(text) == expected
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("Flour 500 g", ("Flour", 500.0, "g")),
+    ("Eggs 2", ("Eggs", 2.0, "")),
+    ("Olive oil 2 tbsp", ("Olive oil", 2.0, "tbsp")),
+    ("Butter ½ cup", ("Butter", 0.5, "cup")),
+    # The last token is tried as the quantity first
+    ("Vitamin B 12", ("Vitamin B", 12.0, "")),
+    ("Salt", None),
+    ("Pinch of salt", None),
+])
+def test_parse_line(line, expected):
+    assert scaling.parse_line(line) == expected
+
+
+def test_parse_converts_to_base_units_and_reports_bad_lines():
+    parsed = scaling.parse("Flour 0.5 kg\n\nsome salt\nMilk 1 cup\nEggs 2")
+    assert parsed.names == ["Flour", "Milk", "Eggs"]
+    assert parsed.dimensions == ["mass", "volume", None]
+    assert parsed.quantities.tolist() == pytest.approx([500.0, 236.588, 2.0])
+    # Line numbers count blank lines, like the textarea the user typed into
+    assert parsed.errors == [{"line": 3, "text": "some salt"}]
+
+
+def test_scale_text_keeps_written_units():
+    text, errors = scaling.scale_text("Flour 500 g\nMilk 1 cup", 3)
+    assert text == "Flour 1500.00 g\nMilk 3.00 cup"
+    assert errors == []
+
+
+def test_scale_text_normalizes_units():
+    text, _ = scaling.scale_text("Flour 500 g\nMilk 1 cup\nEggs 2", 3, normalize=True)
+    assert text == "Flour 1.50 kg\nMilk 709.76 ml\nEggs 6.00"
+
+
+def test_scale_text_batch_matches_scale_text():
+    text = "Flour 500 g\nSugar 1/3 cup\nEggs 2"
+    factors = [0.5, 1, 2.5]
+    batch, errors = scaling.scale_text_batch(text, factors, normalize=True)
+    assert batch == [scaling.scale_text(text, f, normalize=True)[0] for f in factors]
+    assert errors == []
+
+
+def test_items_are_structured_render_output():
+    parsed = scaling.parse("Flour 1500 g\nEggs 2")
+    items = scaling.items(parsed, parsed.quantities, normalize=True)
+    assert items == [("Flour", 1.5, "kg"), ("Eggs", 2.0, "")]
+    assert scaling.render(parsed, parsed.quantities, normalize=True) == "Flour 1.50 kg\nEggs 2.00"
+
+
+def test_extract_ingredients_uses_the_ingredients_section():
+    content = "# Cake\nIntro 1\n## Ingredients\n- Flour 200 g\n* Eggs 2\n## Steps\nBake 30"
+    assert scaling.extract_ingredients(content) == "Flour 200 g\nEggs 2"
+
+
+def test_extract_ingredients_without_a_heading_uses_list_items():
+    content = "Preheat oven to 180 C\n- Flour 200 g\n* Eggs 2\n**Tip** 1\nMix and bake for 30 minutes"
+    assert scaling.extract_ingredients(content) == "Flour 200 g\nEggs 2"
+    assert scaling.extract_ingredients("Preheat oven to 180 C\nBake 30") == ""
+
+
+def test_normalize_text_keeps_line_numbers():
+    assert scaling.normalize_text("  Flour   500 g \n\n bad  line \n\n") == "Flour 500 g\n\nbad line"
+    assert scaling.parse(scaling.normalize_text(" Flour 1 g\n\n bad ")).errors == [{"line": 3, "text": "bad"}]
+
+
+def test_scale_by_many_factors():
+    parsed = scaling.parse("Flour 500 g\nEggs 2")
+    assert scaling.scale(parsed, [0.5, 2]).tolist() == [[250.0, 1.0], [1000.0, 4.0]]
+
+
+def test_scale_many_scales_each_list_by_its_own_factor():
+    lists = [scaling.parse("Flour 500 g\nEggs 2"), scaling.parse(""), scaling.parse("Milk 1 l")]
+    scaled = scaling.scale_many(lists, [2, 3, 0.5])
+    assert [s.tolist() for s in scaled] == [[1000.0, 4.0], [], [500.0]]
+    assert scaling.scale_many([], []) == []
+
+
+def test_display_quantity_picks_the_largest_fitting_unit():
+    assert scaling.display_quantity(1500.0, "g", normalize=True) == (1.5, "kg")
+    assert scaling.display_quantity(999.0, "kg", normalize=True) == (999.0, "g")
+    assert scaling.display_quantity(1500.0, "kg") == (1.5, "kg")
+    # Unknown units are left alone
+    assert scaling.display_quantity(3.0, "pinch", normalize=True) == (3.0, "pinch")
@@ -0,0 +1,332 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import migrations
+from db import SqliteConnection
+from storage import PostgresStorage, SqliteStorage, Storage, like_prefix
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStorage(str(tmp_path / "test.db"), minconn=1, maxconn=4)
+    assert store.migrate() == migrations.latest_version("sqlite")
+    yield store
+    store.close()
+
+
+def add_user(store, username, approved=1, role="user"):
+    assert store.insert_user(username, "hash", username.title(), f"{username}@example.com", "123", role, approved) == 1
+
+
+# ------------------------- Interface -------------------------
+def test_storage_subclasses_must_implement_dialect_statements():
+    class Incomplete(Storage):
+        dialect = "sqlite"
+        def any_of(self, column, values): ...
+        def insert_values(self, cur, query, rows, fetch=False): ...
+        def export_recipes(self, username=None, chunk_size=1): ...
+        def search_recipes(self, username, query, offset, limit): ...
+    with pytest.raises(TypeError, match="shopping_list"):
+        Incomplete(pool=None)
+
+
+def test_like_prefix_escapes_wildcards():
+    assert like_prefix("a_b%c\\") == "a\\_b\\%c\\\\%"
+
+
+# ------------------------- Migrations -------------------------
+def test_migrate_adopts_the_legacy_app_database(tmp_path):
+    # data/app.db as the original app left it: no schema_migrations, nullable
+    # columns, no unique titles and no cascade
+    path = tmp_path / "app.db"
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "app.db"), path)
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        INSERT INTO users VALUES ('alice', 'hash', 'Alice', 'b@x', '1', NULL, NULL);
+        INSERT INTO recipes (username, title, content) VALUES ('alice', 'Bread', '- Flour 500 g');
+        INSERT INTO recipes (username, title, content) VALUES ('alice', 'Bread', 'chocolate twist');
+        INSERT INTO recipes (username, title, content) VALUES ('alice', NULL, NULL);
+        INSERT INTO recipes (username, title, content) VALUES (NULL, 'Orphan', '');
+        INSERT INTO recipes (username, title, content) VALUES ('ghost', 'Unknown owner', '');
+    """)
+    legacy.commit()
+    legacy.close()
+
+    store = SqliteStorage(str(path), minconn=1, maxconn=2)
+    try:
+        assert store.migrate() == migrations.latest_version("sqlite")
+        assert store.find_user("alice")[4:] == ("user", 0)
+        # Its existing users are kept
+        assert store.find_user("admin")[4:] == ("superuser", 1)
+        assert store.find_user("admin12")[4:] == ("user", 1)
+        rows = store.recipes("alice")
+        assert [row[2:] for row in rows] == [
+            ("Bread", "- Flour 500 g"), (f"Bread ({rows[1][0]})", "chocolate twist"), ("Untitled", "")]
+        assert store.execute("SELECT count(*) FROM recipes", fetch="one") == (3,)
+        # Adopted rows are searchable; their ingredients are left to the backfill
+        assert [hit[1] for hit in store.search_recipes("alice", "chocolate", 0, 10)] == [rows[1][2]]
+        assert store.needs_backfill is True
+        assert store.backfill_ingredients() == 3
+        assert store.ingredients("alice", rows[0][0]) == [("Flour", 500.0, "g", "g")]
+        # The new constraints hold
+        assert store.insert_recipes("alice", [("Bread", "again")]) is None
+        assert store.execute("INSERT INTO users (username, password) VALUES ('carol', 'x')") == 1
+        assert store.find_user("carol")[4:] == ("user", 0)
+        assert store.delete_users(["alice"]) == 1
+        assert store.execute("SELECT count(*) FROM recipes", fetch="one") == (0,)
+        # Migrating again is a no-op
+        assert store.migrate() == migrations.latest_version("sqlite")
+    finally:
+        store.close()
+
+
+# ------------------------- Users -------------------------
+def test_users(store):
+    add_user(store, "alice", approved=0)
+    # Existing usernames insert nothing
+    assert store.insert_user("alice", "other", "A", "a@x", "1", "user", 0) == 0
+    assert store.user_exists("alice") is True
+    assert store.user_exists("nobody") is False
+    assert store.find_user("alice") == ("alice", "Alice", "alice@example.com", "123", "user", 0)
+    assert store.user_login("alice") == ("hash", "user", 0)
+    assert store.approve_users(["alice"]) == 1
+    assert store.user_login("alice")[2] == 1
+    assert store.set_password("alice", "new", old_password="wrong") == 0
+    assert store.set_password("alice", "new", old_password="hash") == 1
+    assert store.delete_users(["alice"]) == 1
+    assert store.find_user("alice") is None
+
+
+def test_list_users_filters_and_pages(store):
+    for username in ("a_b", "axb", "bob", "carol"):
+        add_user(store, username, approved=0 if username == "carol" else 1)
+    columns = "username"
+    # _ in a prefix is literal, not a wildcard
+    assert store.list_users(columns, prefix="a_") == [("a_b",)]
+    assert store.list_users(columns, approved=False) == [("carol",)]
+    assert store.list_users(columns, approved=True, limit=2) == [("a_b",), ("axb",)]
+    assert store.list_users(columns, approved=True, after="axb") == [("bob",)]
+
+
+
+def test_keyset_pages_sort_by_code_point(store):
+    # The live views place rows with str comparisons, so pages must agree
+    for name in ("bob", "Alice", "Émile"):
+        add_user(store, name)
+    assert [row[0] for row in store.list_users("username")] == ["Alice", "bob", "Émile"]
+    assert [row[0] for row in store.list_users("username", after="Alice")] == ["bob", "Émile"]
+    titles = ["apple", "Banana", "Éclair", "cherry"]
+    store.insert_recipes("bob", [(title, "") for title in titles])
+    assert [row[1] for row in store.recipe_page("bob", None, 10)] == sorted(titles)
+    assert [row[1] for row in store.recipe_page("bob", "Banana", 10)] == sorted(t for t in titles if t > "Banana")
+    # Postgres sorts by the "C" collation, whatever the database's is
+    postgres = object.__new__(PostgresStorage)
+    assert 'title COLLATE "C">%s' in postgres.statement("recipe_page_after")
+    assert 'ORDER BY title COLLATE "C"' in postgres.statement("recipe_page")
+
+# ------------------------- Recipes -------------------------
+def test_recipe_crud(store):
+    add_user(store, "alice")
+    add_user(store, "bob")
+    ids = store.insert_recipes("alice", [("Bread", "Flour 500 g"), ("Apple pie", "Apples 3"), ("Cake", "Eggs 2")])
+    assert len(ids) == 3
+    assert [row[1] for row in store.recipe_page("alice", None, 2)] == ["Apple pie", "Bread"]
+    assert [row[1] for row in store.recipe_page("alice", "Bread", 2)] == ["Cake"]
+    assert store.recipe("alice", ids[0]) == (ids[0], "alice", "Bread", "Flour 500 g")
+    # Recipes are only visible to their owner
+    assert store.recipe("bob", ids[0]) is None
+    # Titles are unique per user
+    assert store.insert_recipes("alice", [("Bread", "again")]) is None
+    assert store.insert_recipes("bob", [("Bread", "Flour 1 kg")]) is not None
+
+    assert store.update_recipe("alice", ids[0], "Rye bread", "Rye flour 400 g") is True
+    assert store.update_recipe("bob", ids[0], "Stolen", "") is False
+    assert store.recipe("alice", ids[0])[2:] == ("Rye bread", "Rye flour 400 g")
+    assert store.delete_recipes("alice", ids[1:]) == 2
+    assert [row[2] for row in store.recipes("alice")] == ["Rye bread"]
+
+
+def test_rendered_html_is_reset_on_update(store):
+    add_user(store, "alice")
+    [recipe_id] = store.insert_recipes("alice", [("Bread", "Flour 500 g")])
+    assert store.save_rendered(recipe_id, "h1", "<p>x</p>") == 1
+    # Same hash: nothing to write
+    assert store.save_rendered(recipe_id, "h1", "<p>x</p>") == 0
+    assert store.recipe_rendered("alice", recipe_id)[3:] == ("<p>x</p>", "h1")
+    store.update_recipe("alice", recipe_id, "Bread", "Flour 600 g")
+    assert store.recipe_rendered("alice", recipe_id)[3:] == (None, None)
+
+
+def test_search(store):
+    add_user(store, "alice")
+    add_user(store, "bob")
+    store.insert_recipes("alice", [
+        ("Chocolate cake", "Flour 200 g\nCocoa 50 g"),
+        ("Banana bread", "Bananas 3\nFlour 250 g\nwith chocolate chips"),
+        ("Pancakes", "Flour 100 g\nMilk 200 ml"),
+    ])
+    store.insert_recipes("bob", [("Chocolate mousse", "Chocolate 200 g")])
+    hits = store.search_recipes("alice", "chocolate", 0, 10)
+    # Title matches rank first; other users' recipes never match
+    assert [hit[1] for hit in hits] == ["Chocolate cake", "Banana bread"]
+    # Snippets come from the body with matches marked
+    assert "**chocolate**" in hits[1][3]
+    assert [hit[1] for hit in store.search_recipes("alice", "chocolate -banana", 0, 10)] == ["Chocolate cake"]
+    assert [hit[1] for hit in store.search_recipes("alice", "flour", 1, 1)] != []
+    # Query syntax in user input is matched literally
+    assert store.search_recipes("alice", 'cake" OR "x', 0, 10) == []
+
+
+# ------------------------- Ingredients -------------------------
+def test_ingredients_and_shopping_list(store):
+    add_user(store, "alice")
+    bread, pancakes = store.insert_recipes("alice", [
+        ("Bread", "## Ingredients\n- Flour 0.5 kg\n- Water 300 ml\n## Steps\nBake 40"),
+        ("Pancakes", "## Ingredients\n- flour 200 g\n- Milk 1 cup\n- Eggs 2"),
+    ])
+    assert store.ingredients("alice", bread) == [("Flour", 500.0, "g", "kg"), ("Water", 300.0, "ml", "ml")]
+    assert store.ingredients("alice", bread, 2.0)[0][1] == 1000.0
+    assert store.ingredients("bob", bread) == []
+
+    totals = {(name.lower(), unit): qty for name, qty, unit in store.shopping_list("alice", {bread: 1, pancakes: 2})}
+    assert totals[("flour", "g")] == pytest.approx(900.0)
+    assert totals[("milk", "ml")] == pytest.approx(473.176)
+    assert totals[("eggs", "")] == 4.0
+
+    assert [row[1] for row in store.recipes_with_ingredient("alice", "flo")] == ["Bread", "Pancakes"]
+    assert [row[1] for row in store.recipes_with_ingredient("alice", "egg")] == ["Pancakes"]
+
+    # Updates rewrite the parsed rows, deletes cascade
+    store.update_recipe("alice", bread, "Bread", "- Rye 400 g\nBake for 40 minutes")
+    assert store.ingredients("alice", bread) == [("Rye", 400.0, "g", "g")]
+    store.delete_recipes("alice", [bread])
+    assert store.execute("SELECT count(*) FROM recipe_ingredients WHERE recipe_id=%s", (bread,), fetch="one") == (0,)
+
+
+def test_backfill_ingredients(store):
+    add_user(store, "alice")
+    ids = store.insert_recipes("alice", [(f"Recipe {i}", f"- Flour {i + 1} g") for i in range(5)])
+    store.execute("DELETE FROM recipe_ingredients")
+    assert store.backfill_ingredients(batch_size=2) == 5
+    assert store.ingredients("alice", ids[4]) == [("Flour", 5.0, "g", "g")]
+    assert store.backfill_ingredients() == 0
+
+
+def test_failed_backfill_raises_and_resumes(store, monkeypatch):
+    add_user(store, "alice")
+    ids = store.insert_recipes("alice", [(f"Recipe {i}", f"- Flour {i + 1} g") for i in range(4)])
+    store.execute("DELETE FROM recipe_ingredients")
+    store.needs_backfill = True
+    original = store.run
+    batches = []
+    def fail_second_batch(work):
+        batches.append(1)
+        return None if len(batches) == 2 else original(work)
+    monkeypatch.setattr(store, "run", fail_second_batch)
+    # A database error is not mistaken for having parsed everything
+    with pytest.raises(RuntimeError, match="after 2 recipes"):
+        store.backfill_ingredients(batch_size=2)
+    assert store.needs_backfill is True
+    monkeypatch.undo()
+    assert store.backfill_ingredients(batch_size=2) == 2
+    assert store.needs_backfill is False
+    assert store.ingredients("alice", ids[3]) == [("Flour", 4.0, "g", "g")]
+
+
+# ------------------------- Bulk -------------------------
+def test_import_and_export(store):
+    add_user(store, "alice")
+    store.insert_recipes("alice", [("Existing", "old")])
+    records = [
+        {"username": "alice", "title": "New", "content": "Flour 1 g"},
+        {"username": "ghost", "title": "Lost", "content": ""},
+        {"username": "alice", "title": "Existing", "content": "new"},
+    ]
+    assert store.import_recipes(records) == (1, 1)
+    assert store.import_recipes(records, on_conflict="update") == (2, 1)
+    chunks = list(store.export_recipes("alice", chunk_size=1))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert [row[1:] for chunk in chunks for row in chunk] == [("Existing", "new"), ("New", "Flour 1 g")]
+
+
+# ------------------------- Transactions -------------------------
+def test_transaction_rolls_back_and_runs_after_commit(store):
+    add_user(store, "alice")
+    committed = []
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.insert_recipes("alice", [("Draft", "")])
+            store.after_commit(lambda: committed.append("draft"))
+            raise RuntimeError("abort")
+    assert store.recipes("alice") == []
+    assert committed == []
+    with store.transaction():
+        store.insert_recipes("alice", [("Kept", "")])
+        store.after_commit(lambda: committed.append("kept"))
+        assert committed == []
+    assert [row[2] for row in store.recipes("alice")] == ["Kept"]
+    assert committed == ["kept"]
+
+
+class Dropped(Exception):
+    pass
+
+
+def test_run_retries_work_interrupted_before_commit(store, monkeypatch):
+    monkeypatch.setattr(store, "is_disconnect", lambda e: isinstance(e, Dropped))
+    calls = []
+    def work(cur):
+        calls.append(1)
+        if len(calls) == 1:
+            raise Dropped("connection lost")
+        return 42
+    assert store.run(work) == 42
+    assert len(calls) == 2
+
+
+def test_run_does_not_retry_a_failed_commit(store, monkeypatch):
+    # The server may have committed before the connection dropped
+    add_user(store, "alice")
+    monkeypatch.setattr(store, "is_disconnect", lambda e: isinstance(e, Dropped))
+    original = SqliteConnection.commit
+    def commit_then_drop(conn):
+        original(conn)
+        raise Dropped("connection lost during commit")
+    monkeypatch.setattr(SqliteConnection, "commit", commit_then_drop)
+    calls = []
+    def work(cur):
+        calls.append(1)
+        cur.execute("INSERT INTO recipes (username,title,content) VALUES ('alice','Bread','')")
+    assert store.run(work) is None
+    monkeypatch.setattr(SqliteConnection, "commit", original)
+    assert len(calls) == 1
+    assert [row[2] for row in store.recipes("alice")] == ["Bread"]
+
+
+def test_run_recovers_when_every_pooled_connection_dropped(tmp_path):
+    # As after a server restart: all idle connections are dead, none is old
+    # enough for its health check to run
+    store = SqliteStorage(str(tmp_path / "restart.db"), minconn=3, maxconn=3)
+    for conn, _ in store.pool._idle:
+        conn._conn.close()
+    assert store.execute("SELECT 1", fetch="one") == (1,)
+    stats = store.stats()
+    assert stats["reconnects"] == 2
+    assert (stats["size"], stats["idle"]) == (1, 1)
+    store.close()
+
+
+# ------------------------- Sessions -------------------------
+def test_sessions(store):
+    store.save_session("sid", "token-1", expires_at=100.0)
+    assert store.session_token("sid", now=50.0) == "token-1"
+    store.save_session("sid", "token-2", expires_at=200.0)
+    assert store.session_token("sid", now=150.0) == "token-2"
+    assert store.session_token("sid", now=250.0) is None
+    assert store.purge_sessions(now=250.0) == 1
+    store.save_session("other", "t", expires_at=100.0)
+    store.delete_session("other")
+    assert store.session_token("other", now=0.0) is None